@@ -0,0 +1,126 @@
+import os
+import numpy as np
+import faiss
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+
+class IndexConfig:
+    """
+    FAISS index type and tuning knobs.
+
+    flat      exact search, scans every vector
+    ivf_flat  inverted lists over k-means cells; `nprobe` cells are scanned
+    ivf_pq    as ivf_flat with product-quantized codes (`pq_m` bytes/vector)
+    hnsw      graph index; `ef_search` controls the candidate list size
+
+    Approximate types are only used once the index holds `min_vectors`
+    vectors; below that an exact flat index is both faster and smaller.
+    """
+
+    def __init__(self, index_type=None, nlist=None, nprobe=None, pq_m=None, pq_bits=8,
+                 hnsw_m=None, ef_construction=40, ef_search=None, train_size=None, min_vectors=None):
+        self.index_type = index_type or os.getenv("INDEX_TYPE", "flat")
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type {self.index_type!r}, expected one of {INDEX_TYPES}")
+        self.nlist = nlist or int(os.getenv("INDEX_NLIST", "1024"))
+        self.nprobe = nprobe or int(os.getenv("INDEX_NPROBE", "16"))
+        self.pq_m = pq_m or int(os.getenv("INDEX_PQ_M", "48"))
+        self.pq_bits = pq_bits
+        self.hnsw_m = hnsw_m or int(os.getenv("INDEX_HNSW_M", "32"))
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search or int(os.getenv("INDEX_EF_SEARCH", "64"))
+        self.train_size = train_size or int(os.getenv("INDEX_TRAIN_SIZE", "100000"))
+        self.min_vectors = min_vectors if min_vectors is not None else int(os.getenv("INDEX_MIN_VECTORS", "4096"))
+
+    def __repr__(self):
+        return (f"IndexConfig({self.index_type}, nlist={self.nlist}, nprobe={self.nprobe}, "
+                f"pq_m={self.pq_m}, hnsw_m={self.hnsw_m}, ef_search={self.ef_search})")
+
+
+def index_type_of(index):
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def reconstruct_all(index):
+    """Return all vectors stored in `index` (approximate for PQ codes)"""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def build_index(config, vectors):
+    """Create an index of `config.index_type`, train it on a sample of `vectors` and add them all"""
+    n, dim = vectors.shape
+    index_type = config.index_type if n >= config.min_vectors else "flat"
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, config.hnsw_m)
+        index.hnsw.efConstruction = config.ef_construction
+    else:
+        # keep ~39 training points per cell, as faiss's k-means expects
+        nlist = max(1, min(config.nlist, n // 39))
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf_pq":
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, config.pq_m, config.pq_bits)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        sample = vectors
+        if n > config.train_size:
+            rows = np.random.default_rng(0).choice(n, config.train_size, replace=False)
+            sample = vectors[np.sort(rows)]
+        index.train(np.ascontiguousarray(sample, dtype=np.float32))
+    if n:
+        index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    apply_search_params(index, config)
+    return index
+
+
+def apply_search_params(index, config):
+    """Set query-time knobs (nprobe / efSearch) on a loaded index"""
+    index_type = index_type_of(index)
+    if index_type == "hnsw":
+        index.hnsw.efSearch = config.ef_search
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        faiss.extract_index_ivf(index).nprobe = config.nprobe
+    return index
+
+
+def ensure_index_type(index, config):
+    """Rebuild `index` as `config.index_type` if it is large enough and of a different type"""
+    current = index_type_of(index)
+    if config.index_type == current:
+        return apply_search_params(index, config)
+    if config.index_type != "flat" and index.ntotal < config.min_vectors:
+        return apply_search_params(index, config)
+    print(f"[INFO] Converting {current} index with {index.ntotal} vectors to {config.index_type}...")
+    return build_index(config, reconstruct_all(index))
+
+
+def remove_positions(index, positions, config):
+    """
+    Remove vectors at `positions` and compact the remaining ones to 0..n-1,
+    which is the numbering LangChain's index_to_docstore_id relies on.
+    """
+    positions = np.fromiter(positions, dtype=np.int64)
+    if index_type_of(index) == "flat":
+        index.remove_ids(positions)
+        return index
+    # IVF keeps explicit ids and HNSW cannot remove at all, so re-add the survivors
+    vectors = reconstruct_all(index)
+    keep = np.ones(index.ntotal, dtype=bool)
+    keep[positions] = False
+    if isinstance(index, faiss.IndexIVF):
+        index.reset()
+        index.add(np.ascontiguousarray(vectors[keep]))
+        return index
+    return build_index(config, vectors[keep])
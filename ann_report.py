@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Recall@k vs latency report for the FAISS index types in ann_index.py.
+
+The corpus is the chunk vectors already stored in the embedding cache
+(or a .npy matrix). A random sample is held out as queries, every index
+configuration is built on the rest and compared with exact flat search.
+
+    python ann_report.py --k 3 --queries 500 --json ann_report.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import faiss
+from ann_index import IndexConfig, build_index
+from embedding_service import EMBEDDING_MODEL
+from embedding_cache import KEY_SIZE
+
+SWEEPS = {
+    "ivf_flat": ("nprobe", [1, 4, 16, 64]),
+    "ivf_pq": ("nprobe", [1, 4, 16, 64]),
+    "hnsw": ("ef_search", [16, 32, 64, 128]),
+}
+
+
+def load_vectors(path):
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    cache_dir = os.path.join(path, EMBEDDING_MODEL.replace("/", "__"))
+    with open(os.path.join(cache_dir, "dim")) as f:
+        dim = int(f.read())
+    vectors_file = os.path.join(cache_dir, "vectors.f32")
+    # only rows with a key are complete; an interrupted append may have left more
+    n = min(os.path.getsize(os.path.join(cache_dir, "keys.bin")) // KEY_SIZE,
+            os.path.getsize(vectors_file) // (dim * 4))
+    return np.memmap(vectors_file, dtype=np.float32, mode="r", shape=(n, dim))
+
+
+def measure(index, queries, k):
+    """Return (ids, per-query latencies in ms) searching one query at a time"""
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    latencies = []
+    for i, q in enumerate(queries):
+        start = time.perf_counter()
+        _, found = index.search(q[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids[i] = found[0]
+    return ids, np.array(latencies)
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def run(vectors, n_queries, k, nlist, pq_m, hnsw_m):
+    rng = np.random.default_rng(0)
+    rows = rng.permutation(len(vectors))
+    queries = np.ascontiguousarray(vectors[rows[:n_queries]], dtype=np.float32)
+    base = np.ascontiguousarray(vectors[np.sort(rows[n_queries:])], dtype=np.float32)
+    print(f"[INFO] {len(base)} base vectors, {len(queries)} queries, dim {base.shape[1]}, k={k}")
+
+    results = []
+
+    def record(name, param, value, index, build_s, found, latencies, truth):
+        row = {
+            "index_type": name,
+            "param": param,
+            "value": value,
+            "recall_at_k": recall_at_k(found, truth),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "build_s": build_s,
+            "size_mb": faiss.serialize_index(index).nbytes / 1e6,
+        }
+        results.append(row)
+        print(f"{name:9} {param or '':10} {str(value or ''):>5}  recall@{k}={row['recall_at_k']:.3f}  "
+              f"p50={row['p50_ms']:.3f}ms  p95={row['p95_ms']:.3f}ms  size={row['size_mb']:.1f}MB  build={build_s:.1f}s")
+
+    start = time.perf_counter()
+    flat = build_index(IndexConfig("flat"), base)
+    build_s = time.perf_counter() - start
+    truth, latencies = measure(flat, queries, k)
+    record("flat", None, None, flat, build_s, truth, latencies, truth)
+
+    for name, (param, values) in SWEEPS.items():
+        config = IndexConfig(name, nlist=nlist, pq_m=pq_m, hnsw_m=hnsw_m, min_vectors=0)
+        start = time.perf_counter()
+        index = build_index(config, base)
+        build_s = time.perf_counter() - start
+        for value in values:
+            if param == "nprobe":
+                faiss.extract_index_ivf(index).nprobe = value
+            else:
+                index.hnsw.efSearch = value
+            found, latencies = measure(index, queries, k)
+            record(name, param, value, index, build_s, found, latencies, truth)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FAISS index types against exact search")
+    parser.add_argument("--vectors", default="faiss_cache/embeddings",
+                        help="embedding cache directory or a .npy matrix")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--pq-m", type=int, default=48)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.vectors)
+    if len(vectors) <= args.queries:
+        print(f"❌ Need more than {args.queries} vectors, found {len(vectors)}")
+        sys.exit(1)
+    results = run(vectors, args.queries, args.k, args.nlist, args.pq_m, args.hnsw_m)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"k": args.k, "n_vectors": len(vectors), "results": results}, f, indent=2)
+        print(f"[INFO] Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from metrics import counter
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class SemanticAnswerCache:
+    """
+    Process-wide cache of LLM answers keyed by document-set fingerprint and
+    query embedding. A query whose cosine similarity to a cached query on
+    the same documents is at least `threshold` gets the cached answer.
+    """
+
+    def __init__(self, threshold=None, ttl=None, max_entries=None):
+        self.threshold = threshold or float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+        self.ttl = ttl or float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+        self.max_entries = max_entries or int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+        self._entries = OrderedDict()  # key -> (fingerprint, unit vector, answer, created, latency)
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_latency = 0.0
+
+    def _evict(self, now):
+        for key in [k for k, e in self._entries.items() if now - e[3] > self.ttl]:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)  # least recently used
+
+    def lookup(self, fingerprint, query_vector):
+        """Return the cached answer for a near-duplicate query, or None"""
+        vector = _unit(query_vector)
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            keys = [k for k, e in self._entries.items() if e[0] == fingerprint]
+            if keys:
+                matrix = np.stack([self._entries[k][1] for k in keys])
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    key = keys[best]
+                    self._entries.move_to_end(key)
+                    entry = self._entries[key]
+                    self.hits += 1
+                    self.saved_latency += entry[4]
+                    counter("answer_cache_saved_seconds_total",
+                            "LLM latency saved by semantic answer cache hits").inc(entry[4])
+                    return entry[2]
+            self.misses += 1
+            return None
+
+    def store(self, fingerprint, query_vector, answer, latency):
+        with self._lock:
+            self._entries[self._next_key] = (fingerprint, _unit(query_vector), answer, time.time(), latency)
+            self._next_key += 1
+            self._evict(time.time())
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "saved_latency_s": self.saved_latency,
+            "entries": len(self._entries),
+        }
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def get_answer_cache():
+    """Return the process-wide SemanticAnswerCache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticAnswerCache()
+        return _cache
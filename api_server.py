@@ -0,0 +1,531 @@
+"""
+Headless HTTP API for the chatbot.
+
+    python api_server.py          # API_WORKERS processes on API_HOST:API_PORT
+
+    POST /v1/ingest                      PDFs (multipart "files") -> index id; built in the background
+    GET  /v1/indexes/{index_id}          build progress; questions can be asked once "ready"
+    POST /v1/indexes/{index_id}/cancel   stop an unfinished build
+    POST /v1/ask                         {"index_id", "question", "session_id"?, "use_cache"?} -> answer
+                                         (without a session_id the question is answered on its own, unsaved)
+    POST /v1/ask/stream                  same body; the answer as server-sent events
+    GET  /healthz, /readyz               liveness; readiness once the warm-up has finished
+    GET  /metrics                        this worker's Prometheus metrics
+
+Workers are separate processes sharing the on-disk state: uploads
+(UploadStore), indexes (faiss_cache, built under a cross-process lock and
+memory-mapped read-only) and chat histories. An index id is the
+fingerprint of its document set, so any worker behind a load balancer can
+serve any index; the first question for one on a worker loads it from disk.
+While one worker builds an index it publishes the build's progress into
+the index's namespace directory: the other workers report that progress,
+pass a cancel request on through a flag file there and answer questions
+with 503 until the build is done, instead of starting builds of their
+own. A status request never loads an index. Each worker answers
+API_MAX_CONCURRENCY questions at once, queues more for up to
+API_QUEUE_TIMEOUT_S (503 after that) and gives each answer
+API_REQUEST_TIMEOUT_S (504 after that).
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from llm_client import LLMError
+from metrics import REGISTRY, counter, gauge, histogram
+from upload_store import UploadStore
+from warmup import start_warmup, warmup_status
+
+MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "8"))
+QUEUE_TIMEOUT_S = float(os.getenv("API_QUEUE_TIMEOUT_S", "5"))
+REQUEST_TIMEOUT_S = float(os.getenv("API_REQUEST_TIMEOUT_S", "60"))
+MAX_UPLOAD_MB = float(os.getenv("API_MAX_UPLOAD_MB", "200"))
+# how long a question waits for an index this worker is still loading before getting a 503
+READY_WAIT_S = float(os.getenv("API_READY_WAIT_S", "3"))
+# a worker keeps its hold on an index this long after the last request for it
+LEASE_IDLE_S = float(os.getenv("API_LEASE_IDLE_S", "900"))
+MAX_SESSIONS = int(os.getenv("API_MAX_SESSIONS", "1000"))
+# where VectorStoreManager keeps its namespaces; a build's progress is published next to its index
+INDEXES_DIR = os.path.join("faiss_cache", "indexes")
+JOB_PUBLISH_S = 1.0
+# a build whose progress was last published this long ago belongs to a worker that died
+JOB_STALE_S = 10.0
+
+INDEX_ID = r"^[0-9a-f]{16}$"
+# session ids name history files: no path separators, no leading dot
+SESSION_ID = r"^[A-Za-z0-9_-][A-Za-z0-9_.-]{0,63}$"
+
+
+class AskRequest(BaseModel):
+    index_id: str = Field(pattern=INDEX_ID)
+    question: str = Field(min_length=1, max_length=4000)
+    session_id: Optional[str] = Field(None, pattern=SESSION_ID)
+    use_cache: bool = True
+
+
+class _Indexes:
+    """
+    This worker's leases on shared pipelines (see PipelineRegistry), by
+    index id. Holding the lease keeps a background build running between
+    requests; leases unused for LEASE_IDLE_S are given back. The progress
+    of the builds is published to disk every JOB_PUBLISH_S.
+    """
+
+    def __init__(self):
+        self._leases = {}  # index id -> [lease, last used]
+        self._final = {}  # index id -> id of the finished job whose outcome was published
+        self._lock = threading.Lock()
+        self._publisher = None
+
+    def held(self, index_id):
+        """Return this worker's lease on the index, or None; never acquires one"""
+        with self._lock:
+            held = self._leases.get(index_id)
+            if held is None:
+                return None
+            held[1] = time.monotonic()
+            return held[0]
+
+    def get(self, index_id, pdf_files=None, buffers=None):
+        self.release_idle()
+        with self._lock:
+            held = self._leases.get(index_id)
+            if held is not None and not (held[0].job is not None and held[0].job.status in ("failed", "cancelled")):
+                held[1] = time.monotonic()
+                return held[0]
+        if _building_elsewhere(_read_job_record(index_id)):
+            # a second build would only queue on the namespace lock behind it
+            raise HTTPException(503, f"Index {index_id} is still being built", headers={"Retry-After": "2"})
+        try:
+            os.remove(_cancel_file(index_id))  # a cancel request left over from an earlier build
+        except FileNotFoundError:
+            pass
+        if pdf_files is None:
+            pdf_files = UploadStore().load_document_set(index_id)
+            if pdf_files is None:
+                raise HTTPException(404, f"Unknown index {index_id}")
+            missing = [pdf for pdf in pdf_files if not os.path.exists(pdf)]
+            if missing:
+                raise HTTPException(410, f"Index {index_id} refers to {len(missing)} deleted uploads")
+        from pipeline_registry import get_registry
+        # a failed or cancelled build is started over by the registry
+        lease = get_registry().acquire(pdf_files, buffers=buffers, background=True)
+        with self._lock:
+            replaced = self._leases.get(index_id)
+            self._leases[index_id] = [lease, time.monotonic()]
+        if replaced is not None:
+            replaced[0].release()
+        if lease.job is not None:
+            self._publish(index_id, lease)
+            self._start_publisher()
+        return lease
+
+    def _publish(self, index_id, lease):
+        """Write the build's progress where every worker can read it (see _stored_status)"""
+        if _building_elsewhere(_read_job_record(index_id)):
+            return  # this lease's job only waits for another worker's build
+        path = _job_file(index_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"pid": os.getpid(), "updated": time.time(), "status": _index_status(index_id, lease)}, f)
+        os.replace(tmp_path, path)
+
+    def _start_publisher(self):
+        with self._lock:
+            if self._publisher is not None:
+                return
+            self._publisher = threading.Thread(target=self._publish_loop, name="job-publisher", daemon=True)
+            self._publisher.start()
+
+    def _publish_loop(self):
+        """Publish the progress of this worker's builds, and cancel those another worker asked to stop"""
+        while True:
+            time.sleep(JOB_PUBLISH_S)
+            with self._lock:
+                building = {index_id: lease for index_id, (lease, _) in self._leases.items() if lease.job is not None}
+                self._final = {index_id: job_id for index_id, job_id in self._final.items() if index_id in building}
+            for index_id, lease in building.items():
+                job = lease.job
+                if self._final.get(index_id) == job.job_id:
+                    continue
+                try:
+                    if job.active and os.path.exists(_cancel_file(index_id)):
+                        job.cancel()
+                    self._publish(index_id, lease)
+                except OSError as e:
+                    print(f"[WARNING] Could not publish the progress of index {index_id}: {e}")
+                    continue
+                if not job.active:
+                    self._final[index_id] = job.job_id
+
+    def release_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            idle = [index_id for index_id, (lease, last_used) in self._leases.items()
+                    if now - last_used >= LEASE_IDLE_S and not (lease.job is not None and lease.job.active)]
+            leases = [self._leases.pop(index_id)[0] for index_id in idle]
+        for lease in leases:
+            lease.release()
+
+    def release_all(self):
+        with self._lock:
+            leases = [lease for lease, _ in self._leases.values()]
+            self._leases.clear()
+        for lease in leases:
+            lease.release()
+
+
+class _Sessions:
+    """LRU of ChatSessions, so a session's turns are saved in order by this worker"""
+
+    def __init__(self, max_sessions=MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        from rag_pipeline import ChatSession
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = ChatSession(session_id)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
+
+
+def _session_for(request):
+    """The request's named session, or a one-off session whose history is never saved"""
+    if request.session_id:
+        return _sessions.get(request.session_id)
+    from rag_pipeline import ChatSession
+    return ChatSession(None, persist=False)
+
+
+_indexes = _Indexes()
+_sessions = _Sessions()
+_slots = None  # asyncio.Semaphore of MAX_CONCURRENCY, created on the server's event loop
+
+
+def _valid_index_id(index_id):
+    return re.match(INDEX_ID, index_id) is not None
+
+
+def _index_status(index_id, lease):
+    pipeline = lease.pipeline
+    status = {"index_id": index_id, "ready": pipeline.ready, "complete": pipeline.complete,
+              "coverage": dict(pipeline.coverage), "job": None}
+    if lease.job is not None:
+        progress = lease.job.progress()
+        # report files by content hash rather than by blob path
+        progress["files"] = {os.path.splitext(os.path.basename(pdf))[0]: entry
+                             for pdf, entry in progress["files"].items()}
+        status["job"] = progress
+    return status
+
+
+def _job_file(index_id):
+    return os.path.join(INDEXES_DIR, index_id, ".job.json")
+
+
+def _cancel_file(index_id):
+    return os.path.join(INDEXES_DIR, index_id, ".cancel")
+
+
+def _read_job_record(index_id):
+    """Return the last published {pid, updated, status} of the index's build, or None"""
+    try:
+        with open(_job_file(index_id)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _live(record):
+    """True if `record` is of a build still in progress on a live worker"""
+    return (record is not None and record["status"]["job"] is not None
+            and record["status"]["job"]["status"] in ("queued", "running")
+            and time.time() - record["updated"] < JOB_STALE_S)
+
+
+def _building_elsewhere(record):
+    return _live(record) and record["pid"] != os.getpid()
+
+
+def _stored_status(index_id):
+    """
+    Status of an index this worker holds no lease on, from disk: the
+    progress of a build in progress, else how much of the document set
+    the cached namespace covers and how its last build ended
+    """
+    record = _read_job_record(index_id)
+    if _live(record):
+        return record["status"]
+    pdf_files = UploadStore().load_document_set(index_id)
+    if pdf_files is None:
+        raise HTTPException(404, f"Unknown index {index_id}")
+    doc_hashes = {os.path.splitext(os.path.basename(pdf))[0] for pdf in pdf_files}
+    try:
+        with open(os.path.join(INDEXES_DIR, index_id, "docs.json")) as f:
+            documents_ready = len(doc_hashes & set(json.load(f)))
+    except (FileNotFoundError, ValueError):
+        documents_ready = 0
+    return {"index_id": index_id, "ready": documents_ready > 0, "complete": documents_ready == len(doc_hashes),
+            "coverage": {"documents_ready": documents_ready, "documents_total": len(doc_hashes)},
+            "job": record["status"]["job"] if record is not None else None}
+
+
+async def _require_ready(index_id, lease):
+    # loading an index already built on disk takes a moment; don't bounce the first question
+    deadline = time.monotonic() + READY_WAIT_S
+    while not lease.pipeline.ready and lease.job is not None and lease.job.active and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    if lease.pipeline.ready:
+        return
+    job = lease.job
+    if job is not None and job.status == "failed":
+        raise HTTPException(500, f"Building index {index_id} failed: {job.error}")
+    if job is None or job.status == "done":
+        # the build finished without a vectorstore: not one chunk of text came out of the PDFs
+        raise HTTPException(422, f"Nothing was indexed for {index_id}: no text could be extracted from its PDFs "
+                                 "(scanned or image-only PDFs need OCR first)")
+    raise HTTPException(503, f"Index {index_id} is still being built", headers={"Retry-After": "2"})
+
+
+async def _admit():
+    """Take one of this worker's answer slots, or 503 after QUEUE_TIMEOUT_S"""
+    try:
+        await asyncio.wait_for(_slots.acquire(), QUEUE_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        counter("api_rejected_total", "Questions rejected because every answer slot was busy").inc()
+        raise HTTPException(503, "Server busy, try again", headers={"Retry-After": "1"})
+    gauge("api_inflight_requests", "Questions being answered by this worker").inc()
+
+
+def _release_slot():
+    gauge("api_inflight_requests", "Questions being answered by this worker").dec()
+    _slots.release()
+
+
+def _observe(endpoint, start, status):
+    counter("api_requests_total", "API requests by endpoint and status", ["endpoint", "status"]).inc(
+        endpoint=endpoint, status=str(status))
+    histogram("api_request_seconds", "API request latency by endpoint", ["endpoint"]).observe(
+        time.perf_counter() - start, endpoint=endpoint)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global _slots
+    _slots = asyncio.Semaphore(MAX_CONCURRENCY)
+    start_warmup()
+    print(f"[INFO] API worker {os.getpid()} ready to serve "
+          f"({MAX_CONCURRENCY} concurrent answers, {REQUEST_TIMEOUT_S:.0f}s timeout)")
+    yield
+    _indexes.release_all()
+
+
+app = FastAPI(title="Smart PDF Chatbot API", lifespan=lifespan)
+
+
+@app.post("/v1/ingest", status_code=202)
+async def ingest(files: List[UploadFile] = File(...)):
+    """Store the PDFs and start building their index; poll GET /v1/indexes/{index_id} for progress"""
+    start = time.perf_counter()
+    store = UploadStore()
+    pdf_files, buffers = [], {}
+    for file in files:
+        data = await file.read()
+        if len(data) > MAX_UPLOAD_MB * 1e6:
+            raise HTTPException(413, f"{file.filename} is larger than {MAX_UPLOAD_MB:.0f} MB")
+        if not data.startswith(b"%PDF"):
+            raise HTTPException(415, f"{file.filename} is not a PDF")
+        doc_hash, path = await run_in_threadpool(store.put, data)
+        if path not in buffers:
+            pdf_files.append(path)
+            buffers[path] = data
+    from vectorstore_manager import document_set_fingerprint
+    doc_hashes = [os.path.splitext(os.path.basename(pdf))[0] for pdf in pdf_files]
+    index_id = document_set_fingerprint(doc_hashes)
+    await run_in_threadpool(store.save_document_set, index_id, doc_hashes)
+    if _indexes.held(index_id) is None and _building_elsewhere(await run_in_threadpool(_read_job_record, index_id)):
+        _observe("ingest", start, 202)
+        return await run_in_threadpool(_stored_status, index_id)
+    lease = await run_in_threadpool(_indexes.get, index_id, pdf_files, buffers)
+    _observe("ingest", start, 202)
+    return _index_status(index_id, lease)
+
+
+@app.get("/v1/indexes/{index_id}")
+async def index_status(index_id: str):
+    if not _valid_index_id(index_id):
+        raise HTTPException(404, f"Unknown index {index_id}")
+    lease = _indexes.held(index_id)
+    if lease is None:
+        return await run_in_threadpool(_stored_status, index_id)
+    return _index_status(index_id, lease)
+
+
+@app.post("/v1/indexes/{index_id}/cancel")
+async def cancel_index(index_id: str):
+    if not _valid_index_id(index_id):
+        raise HTTPException(404, f"Unknown index {index_id}")
+    lease = _indexes.held(index_id)
+    if lease is not None and lease.job is not None and lease.job.active:
+        lease.job.cancel()
+    if _building_elsewhere(await run_in_threadpool(_read_job_record, index_id)):
+        # the worker building it checks for this flag every JOB_PUBLISH_S
+        await run_in_threadpool(lambda: open(_cancel_file(index_id), "a").close())
+    if lease is None:
+        return await run_in_threadpool(_stored_status, index_id)
+    return _index_status(index_id, lease)
+
+
+@app.post("/v1/ask")
+async def ask(request: AskRequest):
+    start = time.perf_counter()
+    status = 500
+    try:
+        lease = await run_in_threadpool(_indexes.get, request.index_id)
+        await _require_ready(request.index_id, lease)
+        session = _session_for(request)
+        await _admit()
+        try:
+            answer = await asyncio.wait_for(
+                lease.pipeline.aask(request.question, session, use_cache=request.use_cache), REQUEST_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            raise HTTPException(504, f"No answer within {REQUEST_TIMEOUT_S:g}s")
+        except LLMError as e:
+            raise HTTPException(502, f"The language model is unavailable: {e}")
+        finally:
+            _release_slot()
+        status = 200
+        return {"answer": answer, "session_id": session.session_id, "coverage": session.last_coverage,
+                "timings": session.last_timings}
+    except HTTPException as e:
+        status = e.status_code
+        raise
+    finally:
+        _observe("ask", start, status)
+
+
+def _event(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+_END = object()  # returned by next() once a streamed answer is exhausted
+
+
+def _end_answer(answer, pending=None):
+    """Stop a streamed answer that is not running in a thread and give its slot back"""
+    if pending is not None and not pending.cancelled():
+        pending.exception()  # nobody reads this chunk any more; don't log it as unretrieved
+    try:
+        answer.close()
+    finally:
+        _release_slot()
+
+
+@app.post("/v1/ask/stream")
+async def ask_stream(request: AskRequest):
+    """
+    Stream the answer as server-sent events: {"token": ...} per chunk, then
+    {"done": true, ...} or {"error": ...}. Errors after the first byte can
+    only be reported in the stream, since the 200 status is already sent;
+    that includes "Server busy" when no answer slot frees up in time.
+    """
+    start = time.perf_counter()
+    try:
+        lease = await run_in_threadpool(_indexes.get, request.index_id)
+        await _require_ready(request.index_id, lease)
+    except HTTPException as e:
+        _observe("ask_stream", start, e.status_code)
+        raise
+    session = _session_for(request)
+
+    async def events():
+        # the slot is taken here rather than before returning the response: a client gone before
+        # the body is iterated never runs this generator, and its finally would never give the slot back
+        status = 200
+        answer = pending = None
+        try:
+            try:
+                await _admit()
+            except HTTPException as e:
+                status = e.status_code
+                yield _event({"error": e.detail})
+                return
+            answer = lease.pipeline.ask_stream(request.question, session, use_cache=request.use_cache)
+            deadline = time.monotonic() + REQUEST_TIMEOUT_S
+            while True:
+                pending = asyncio.ensure_future(run_in_threadpool(next, answer, _END))
+                await asyncio.wait({pending}, timeout=max(deadline - time.monotonic(), 0))
+                if not pending.done():
+                    raise asyncio.TimeoutError()
+                chunk = pending.result()
+                if chunk is _END:
+                    break
+                yield _event({"token": chunk})
+            yield _event({"done": True, "session_id": session.session_id, "coverage": session.last_coverage,
+                          "timings": session.last_timings})
+        except asyncio.TimeoutError:
+            status = "timeout"
+            yield _event({"error": f"No answer within {REQUEST_TIMEOUT_S:g}s"})
+        except LLMError as e:
+            status = "llm_error"
+            yield _event({"error": f"The language model is unavailable: {e}"})
+        finally:
+            if answer is not None:
+                if pending is None or pending.done():
+                    _end_answer(answer)
+                else:
+                    # timed out or disconnected mid-chunk: the answer thread can't be interrupted,
+                    # so its slot stays taken until it hands the chunk back
+                    pending.add_done_callback(lambda done: _end_answer(answer, done))
+            _observe("ask_stream", start, status)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok", "pid": os.getpid()}
+
+
+@app.get("/readyz")
+async def readyz():
+    warmup = warmup_status()
+    ready = warmup["status"] in ("done", "failed") or os.getenv("WARMUP", "1") == "0"
+    body = {"ready": ready, "warmup": warmup, "max_concurrency": MAX_CONCURRENCY}
+    if not ready:
+        raise HTTPException(503, body)
+    return body
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def main():
+    import uvicorn
+    workers = int(os.getenv("API_WORKERS", "1"))
+    # workers import the app themselves; this process only supervises them
+    uvicorn.run("api_server:app", host=os.getenv("API_HOST", "0.0.0.0"), port=int(os.getenv("API_PORT", "8000")),
+                workers=workers, timeout_keep_alive=int(os.getenv("API_KEEPALIVE_S", "5")))
+
+
+if __name__ == "__main__":
+    main()
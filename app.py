@@ -1,7 +1,11 @@
 import streamlit as st
-from rag_pipeline import RAGPipeline
+# Keep these imports light: rag_pipeline (langchain, FAISS, torch) is imported
+# when the first pipeline is built, and warmed up in the background meanwhile.
+from llm_client import LLMError
+from metrics import REGISTRY, format_trace, start_metrics_server
+from warmup import start_warmup, warmup_status
 from session_manager import SessionManager
-from history_manager import HistoryManager
+from upload_store import UploadStore
 import os
 
 # -------------------------------
@@ -13,6 +17,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Prometheus /metrics sidecar (only when METRICS_PORT is set; started once per process)
+start_metrics_server()
+
 # -------------------------------
 # Enhanced Modern UI Styling
 # -------------------------------
@@ -360,6 +367,8 @@ with st.sidebar:
             )
             if st.button("💾 Save", use_container_width=True):
                 updated_name = st.session_state.session_manager.rename_session(selected, new_name)
+                if selected in st.session_state.get("chat_sessions", {}):
+                    st.session_state.chat_sessions[updated_name] = st.session_state.chat_sessions.pop(selected)
                 st.session_state.active_session = updated_name
                 st.session_state.chat_history = st.session_state.sessions[updated_name]
                 st.success(f"✓ Renamed!")
@@ -381,6 +390,25 @@ with st.sidebar:
         </div>
         """, unsafe_allow_html=True)
     
+    # Debug panel: where the last answer spent its time, plus process metrics
+    if os.getenv("DEBUG_PANEL", "0") == "1":
+        with st.expander("🔧 Debug: Metrics", expanded=False):
+            debug_session = st.session_state.get("chat_sessions", {}).get(st.session_state.active_session)
+            if debug_session is not None and debug_session.last_trace:
+                st.markdown("**Last answer**")
+                st.code(format_trace(debug_session.last_trace), language=None)
+                st.caption(f"Prompt tokens: {debug_session.last_prompt_stats.get('total', 0)}")
+            rows = []
+            for name, values in sorted(REGISTRY.snapshot().items()):
+                for labels, value in sorted(values.items()):
+                    if isinstance(value, tuple):
+                        total, count = value
+                        value = f"{count} × avg {total / count:.4g}" if count else "0"
+                    rows.append({"metric": name.removeprefix("smartpdf_"), "labels": labels, "value": str(value)})
+            st.dataframe(rows, hide_index=True, use_container_width=True)
+            warm = warmup_status()
+            st.caption(f"Warm-up: {warm['status']} " + ", ".join(f"{k} {v:.1f}s" for k, v in warm["timings"].items()))
+
     # Footer info
     st.markdown("<div style='height: 2rem;'></div>", unsafe_allow_html=True)
     st.markdown("""
@@ -467,24 +495,85 @@ if uploaded_files:
     </div>
     """, unsafe_allow_html=True)
     
-    pdf_paths = []
-    os.makedirs("data", exist_ok=True)
+    # Store each upload once, content-addressed; reruns reuse the stored blob without touching the disk
+    upload_store = UploadStore()
+    stored_uploads = st.session_state.setdefault("stored_uploads", {})
+    pdf_paths, pdf_buffers, upload_names = [], {}, {}
     for file in uploaded_files:
-        file_path = os.path.join("data", file.name)
-        with open(file_path, "wb") as f:
-            f.write(file.getbuffer())
+        upload_key = getattr(file, "file_id", None) or (file.name, file.size)
+        if upload_key not in stored_uploads or not os.path.exists(stored_uploads[upload_key]):
+            # new upload, or its blob was pruned while the session sat idle
+            stored_uploads[upload_key] = upload_store.put(file.getbuffer())[1]
+        file_path = stored_uploads[upload_key]
         pdf_paths.append(file_path)
-
-    # Initialize persistent pipeline and history manager
-    if "pipeline" not in st.session_state or st.session_state.pipeline is None:
-        with st.spinner("🔄 Processing documents and building knowledge base..."):
-            st.session_state.pipeline = RAGPipeline(st.session_state.active_session, pdf_paths)
-            st.session_state.history_manager = HistoryManager(st.session_state.active_session)
-            # Load existing history for the active session
-            st.session_state.chat_history = st.session_state.history_manager.load_history()
-
-    pipeline = st.session_state.pipeline
-    history_manager = st.session_state.history_manager
+        pdf_buffers[file_path] = file.getbuffer()
+        upload_names[file_path] = file.name
+
+    # Lease the process-wide pipeline for this document set (shared by every tab on the same PDFs);
+    # a new set of uploads releases the old lease. The index is built by a background job, so the
+    # page stays responsive and the chat opens as soon as the first PDF is indexed.
+    lease = st.session_state.get("pipeline_lease")
+    if lease is None or st.session_state.get("pipeline_docs") != pdf_paths:
+        from pipeline_registry import get_registry
+        if lease is not None:
+            lease.release()
+        lease = st.session_state.pipeline_lease = get_registry().acquire(
+            pdf_paths, buffers=pdf_buffers, background=True)
+        st.session_state.pipeline_docs = pdf_paths
+    pipeline = lease.pipeline
+    job = lease.job
+
+    if job is not None and job.status in ("failed", "cancelled"):
+        if job.status == "failed":
+            st.error(f"⚠️ Indexing failed: {job.error}")
+        else:
+            st.warning("✖ Indexing was cancelled.")
+        if st.button("🔁 Retry indexing"):
+            lease.release()
+            st.session_state.pipeline_lease = None
+            st.session_state.pipeline_docs = None
+            st.rerun()
+        st.stop()
+
+    @st.fragment(run_every=1.0)
+    def indexing_progress(job, was_ready):
+        progress = job.progress()
+        if not job.active or pipeline.ready != was_ready:
+            # open the chat, or show the job's outcome
+            st.rerun()
+        st.progress(min(progress["fraction"], 1.0),
+                    text=f"🔄 Indexing documents: {progress['documents_ready']} of "
+                         f"{progress['documents_total']} ready ({progress['elapsed_s']:.0f}s)")
+        with st.expander("Per-file progress"):
+            st.dataframe([
+                {"file": upload_names.get(pdf, os.path.basename(pdf)), "stage": entry["stage"],
+                 "pages": entry.get("pages"), "chunks": entry.get("chunks"),
+                 "embedded": f"{entry.get('embedded', 0)}/{entry['unique']}" if "unique" in entry else None}
+                for pdf, entry in progress["files"].items()
+            ], hide_index=True, use_container_width=True)
+        if st.button("✖ Cancel indexing", key=f"cancel_{job.job_id}"):
+            job.cancel()
+
+    if job is not None and job.active:
+        indexing_progress(job, pipeline.ready)
+    if not pipeline.ready:
+        if job is None or not job.active:
+            # the build finished, yet nothing is searchable
+            st.error("⚠️ No text could be extracted from the uploaded PDFs, so there is nothing to chat about. "
+                     "Scanned or image-only PDFs need OCR first; please upload PDFs with selectable text.")
+        else:
+            st.info("💡 The chat opens as soon as the first document is indexed.")
+        st.stop()
+
+    # Per-conversation state (history, last answer's timings); cheap, one per chat in this tab
+    chat_sessions = st.session_state.setdefault("chat_sessions", {})
+    if st.session_state.active_session not in chat_sessions:
+        from rag_pipeline import ChatSession
+        chat_sessions[st.session_state.active_session] = ChatSession(st.session_state.active_session)
+        if not st.session_state.chat_history:
+            # Load existing history for the session
+            st.session_state.chat_history.extend(chat_sessions[st.session_state.active_session].history.load_history())
+    chat_session = chat_sessions[st.session_state.active_session]
 
     # -------------------------------
     # Display Previous Chat
@@ -531,14 +620,25 @@ if uploaded_files:
             with st.chat_message("user"):
                 st.markdown(user_query)
 
-            answer = pipeline.ask(user_query)
-
+            # Stream the answer; the pipeline saves the turn to history once it completes
             with st.chat_message("assistant"):
-                st.markdown(answer)
-
-            # Save to history manager
-            history_manager.save_turn("user", user_query)
-            history_manager.save_turn("assistant", answer)
+                placeholder = st.empty()
+                answer = ""
+                try:
+                    for chunk in pipeline.ask_stream(user_query, chat_session):
+                        answer += chunk
+                        placeholder.markdown(answer + "▌")
+                except LLMError as e:
+                    placeholder.empty()
+                    st.error(f"⚠️ Could not get an answer, please try again. ({e})")
+                    # let the same question be asked again
+                    st.session_state.last_user_query = None
+                    st.stop()
+                placeholder.markdown(answer)
+                coverage = chat_session.last_coverage
+                if coverage.get("documents_ready", 0) < coverage.get("documents_total", 0):
+                    st.caption(f"ℹ️ Answered from {coverage['documents_ready']} of {coverage['documents_total']} "
+                               "documents indexed so far")
 
             # Update session-specific chat history
             st.session_state.chat_history.append({"role": "user", "content": user_query})
@@ -551,6 +651,7 @@ if uploaded_files:
                 new_name = st.session_state.session_manager.rename_session(
                     st.session_state.active_session, suggested_name
                 )
+                chat_sessions[new_name] = chat_sessions.pop(st.session_state.active_session)
                 st.session_state.active_session = new_name
                 st.session_state.chat_history = st.session_state.sessions[new_name]
         else:
@@ -591,3 +692,8 @@ else:
         </div>
     </div>
     """, unsafe_allow_html=True)
+
+# -------------------------------
+# Background warm-up (runs once per process, after the first paint)
+# -------------------------------
+start_warmup()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Answer a list of questions against a set of PDFs in one run.
+
+Questions are embedded in batches and searched with a single vectorized
+FAISS call per batch (fused with BM25 results, see retrieval.py); LLM calls run with bounded parallelism, and retries
+with backoff come from the llm_client layer (LLM_BACKEND=stub runs offline).
+Results are appended to a JSONL file as they complete, and re-running
+the same command skips questions that already have an answer.
+
+    python batch_qa.py questions.txt data/*.pdf --out answers.jsonl --workers 8
+
+The questions file is either plain text (one question per line) or JSONL
+with {"id": ..., "question": ...} objects.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+from vectorstore_manager import VectorStoreManager
+from prompt_builder import PromptBuilder
+from retrieval import HybridRetriever
+from llm_client import get_llm, LLMError
+
+
+def load_questions(path):
+    """Return [(id, question)] from a .txt or .jsonl file"""
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                item = json.loads(line)
+                questions.append((str(item.get("id", n)), item["question"]))
+            else:
+                questions.append((str(n), line))
+    return questions
+
+
+def load_done(out_path):
+    """Return ids that already have an answer in the output file"""
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn line from an interrupted run
+            if "answer" in record:
+                done.add(record["id"])
+    return done
+
+
+class BatchQA:
+    def __init__(self, pdf_files, llm=None, k=3, workers=8, retries=3, batch_size=256):
+        manager = VectorStoreManager()
+        self.vectorstore = manager.load_or_create_vectorstore(pdf_files)
+        if self.vectorstore is None:
+            raise ValueError("❌ No documents could be loaded from the given PDFs.")
+        self.llm = llm or get_llm(max_retries=retries)
+        self.prompt_builder = PromptBuilder()
+        self.retriever = HybridRetriever(self.vectorstore, k=k)
+        self.workers = workers
+        self.batch_size = batch_size
+
+    def search(self, questions):
+        """Embed all questions in one batch and return the top-k docs for each"""
+        # bypass the chunk embedding cache; questions are not worth persisting
+        embeddings = getattr(self.vectorstore.embedding_function, "embeddings", self.vectorstore.embedding_function)
+        vectors = np.asarray(embeddings.embed_documents(questions), dtype=np.float32)
+        return self.retriever.retrieve_many(questions, vectors)
+
+    async def _answer(self, semaphore, question, docs):
+        """Return (answer or None, error or None)"""
+        prompt, _ = self.prompt_builder.build(question, docs, None, sections=("", []))
+        async with semaphore:
+            try:
+                return await self.llm.aget_response(prompt), None
+            except LLMError as e:
+                return None, str(e)
+
+    async def run(self, questions, out_path):
+        done = load_done(out_path)
+        todo = [(qid, q) for qid, q in questions if qid not in done]
+        print(f"[INFO] {len(questions)} questions, {len(done)} already answered, {len(todo)} to go")
+        semaphore = asyncio.Semaphore(self.workers)
+        answered = failed = 0
+        start = time.perf_counter()
+
+        with open(out_path, "a", encoding="utf-8") as out:
+            async def handle(qid, question, docs):
+                nonlocal answered, failed
+                t0 = time.perf_counter()
+                answer, error = await self._answer(semaphore, question, docs)
+                record = {"id": qid, "question": question,
+                          "latency_s": round(time.perf_counter() - t0, 3),
+                          "sources": sorted({d.metadata.get("source", "") for d in docs})}
+                if error is None:
+                    record["answer"] = answer
+                    answered += 1
+                else:
+                    record["error"] = error
+                    failed += 1
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+
+            for i in range(0, len(todo), self.batch_size):
+                batch = todo[i:i + self.batch_size]
+                docs_per_question = await asyncio.to_thread(self.search, [q for _, q in batch])
+                await asyncio.gather(*[
+                    handle(qid, q, docs) for (qid, q), docs in zip(batch, docs_per_question)
+                ])
+                elapsed = time.perf_counter() - start
+                print(f"[INFO] {answered + failed}/{len(todo)} done ({failed} failed), "
+                      f"{(answered + failed) / elapsed:.1f} questions/s")
+        return answered, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of questions against PDFs")
+    parser.add_argument("questions", help=".txt (one per line) or .jsonl ({id, question}) file")
+    parser.add_argument("pdfs", nargs="+", help="PDF files to answer from")
+    parser.add_argument("--out", default="answers.jsonl")
+    parser.add_argument("--workers", type=int, default=8, help="parallel LLM calls")
+    parser.add_argument("--retries", type=int, default=3, help="LLM retries per question")
+    parser.add_argument("--k", type=int, default=3, help="chunks retrieved per question")
+    parser.add_argument("--batch-size", type=int, default=256, help="questions embedded per batch")
+    args = parser.parse_args()
+
+    qa = BatchQA(args.pdfs, k=args.k, workers=args.workers, retries=args.retries, batch_size=args.batch_size)
+    answered, failed = asyncio.run(qa.run(load_questions(args.questions), args.out))
+    print(f"[INFO] Finished: {answered} answered, {failed} failed -> {args.out}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Benchmark ingestion, index loading and question answering on a synthetic
+PDF corpus.
+
+A deterministic corpus of `--docs` PDFs is generated, the vectorstore is
+built from scratch `--builds` times (cold caches), loaded `--loads` times
+from disk, and `--queries` questions are asked through RAGPipeline with
+the offline stub LLM. Every stage is reported as p50/p95/p99 together
+with peak RSS, and the JSON report can be compared with an earlier one:
+
+    python benchmark.py --docs 50 --pages 5 --json bench.json
+    python benchmark.py --docs 50 --pages 5 --json bench_new.json --compare bench.json
+"""
+
+import os
+import io
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import resource
+import subprocess
+import contextlib
+import numpy as np
+
+WORDS = (
+    "pressure valve gasket flange torque assembly housing bearing seal pump motor sensor calibration "
+    "inspection warranty supplier invoice contract clause liability termination payment schedule delivery "
+    "revision drawing tolerance material steel aluminum coating thickness weight rating voltage current "
+    "maintenance interval procedure safety hazard operator manual figure table section appendix reference "
+    "temperature range nominal maximum minimum approved rejected batch serial customer order quantity"
+).split()
+
+
+# --- Synthetic corpus ---
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages):
+    """Write a minimal text-only PDF; `pages` is a list of lists of lines"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        content = "BT /F1 9 Tf 40 800 Td 11 TL " + " ".join(f"({_escape(line)}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {len(objects)} 0 R "
+                       f"/Resources << /Font << /F1 3 0 R >> >> >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def generate_corpus(out_dir, docs, pages, lines_per_page=60, seed=0):
+    """Generate `docs` PDFs; returns (pdf paths, sample facts usable as questions)"""
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    paths, facts = [], []
+    for d in range(docs):
+        doc_pages = []
+        for p in range(pages):
+            lines = []
+            for n in range(lines_per_page):
+                words = rng.choices(WORDS, k=rng.randint(8, 14))
+                if n % 10 == 0:
+                    part = f"{rng.choice('ABCDKXZ')}{rng.choice('KLMPQ')}-{rng.randint(1000, 9999)}.{rng.choice('ABC')}"
+                    words.insert(rng.randrange(len(words)), part)
+                    facts.append(f"What does the document say about part {part}?")
+                elif n % 7 == 0:
+                    facts.append(f"Explain the {' '.join(words[:3])} requirements")
+                lines.append(f"{d}.{p}.{n} " + " ".join(words).capitalize() + ".")
+            doc_pages.append(lines)
+        path = os.path.join(out_dir, f"doc_{d:04d}.pdf")
+        write_pdf(path, doc_pages)
+        paths.append(path)
+    rng.shuffle(facts)
+    return paths, facts
+
+
+# --- Measurement helpers ---
+
+def summarize(values_ms):
+    values = np.asarray(values_ms, dtype=np.float64)
+    if values.size == 0:
+        return {"n": 0}
+    return {
+        "n": int(values.size),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+    }
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3  # KiB on Linux
+
+
+def record(samples, stage, value_ms):
+    samples.setdefault(stage, []).append(value_ms)
+
+
+@contextlib.contextmanager
+def quiet(verbose):
+    if verbose:
+        yield
+    else:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+# --- Benchmarks ---
+
+def bench_ingest(pdfs, builds, verbose):
+    """Cold builds: every run starts without an index or embedding cache"""
+    from embedding_cache import clear_embedding_caches
+    from vectorstore_manager import VectorStoreManager
+
+    samples = {}
+    for _ in range(builds):
+        shutil.rmtree("faiss_cache", ignore_errors=True)
+        clear_embedding_caches()  # the shared cache would still hold the deleted rows
+        manager = VectorStoreManager()
+        start = time.perf_counter()
+        with quiet(verbose):
+            vectorstore = manager.load_or_create_vectorstore(pdfs)
+        manager.unload(manager.fingerprint)
+        record(samples, "total", (time.perf_counter() - start) * 1000)
+        for stage in ("parse", "split", "dedup", "embed", "index", "persist"):
+            record(samples, stage, manager.last_timings.get(stage, 0.0) * 1000)
+    chunks = len(vectorstore.index_to_docstore_id) if vectorstore is not None else 0
+    return {stage: summarize(v) for stage, v in samples.items()}, chunks
+
+
+def bench_load(pdfs, loads, verbose):
+    """Loads from disk into a process with nothing cached in memory"""
+    from vectorstore_manager import VectorStoreManager
+
+    samples = {}
+    for _ in range(loads):
+        manager = VectorStoreManager()
+        start = time.perf_counter()
+        with quiet(verbose):
+            manager.load_or_create_vectorstore(pdfs)
+        manager.unload(manager.fingerprint)
+        record(samples, "total", (time.perf_counter() - start) * 1000)
+        record(samples, "load", manager.last_timings.get("load", 0.0) * 1000)
+    return {stage: summarize(v) for stage, v in samples.items()}
+
+
+def bench_queries(pdfs, questions, warmup, llm_latency_ms, verbose):
+    from rag_pipeline import ChatSession, RAGPipeline
+    from llm_client import LocalStubBackend, ResilientLLM
+
+    llm = ResilientLLM(LocalStubBackend(latency_ms=llm_latency_ms, tokens_per_s=0, jitter=0))
+    shutil.rmtree("chat_history", ignore_errors=True)
+    with quiet(verbose):
+        pipeline = RAGPipeline(pdfs, llm=llm)
+        session = ChatSession("benchmark")
+    samples = {}
+    for i, question in enumerate(questions):
+        start = time.perf_counter()
+        with quiet(verbose):
+            pipeline.ask(question, session, use_cache=False)
+        elapsed = (time.perf_counter() - start) * 1000
+        if i < warmup:
+            continue
+        record(samples, "total", elapsed)
+        for stage, value in session.last_timings.items():
+            if stage.endswith("_ms"):
+                record(samples, stage[:-3], value)
+    return {stage: summarize(v) for stage, v in samples.items()}
+
+
+def print_section(title, stats):
+    print(f"\n{title}")
+    for stage, s in stats.items():
+        if s.get("n"):
+            print(f"  {stage:14} p50 {s['p50_ms']:9.2f}ms  p95 {s['p95_ms']:9.2f}ms  p99 {s['p99_ms']:9.2f}ms  (n={s['n']})")
+
+
+def compare(report, baseline):
+    """Print p50/p95 changes against a baseline report"""
+    print(f"\nCompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):")
+    for section in ("ingest", "load", "query"):
+        for stage, s in report.get(section, {}).items():
+            old = baseline.get(section, {}).get(stage)
+            if not s.get("n") or not old or not old.get("n"):
+                continue
+            deltas = []
+            for key in ("p50_ms", "p95_ms"):
+                change = (s[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+                deltas.append(f"{key[:3]} {old[key]:.2f} -> {s[key]:.2f}ms ({change:+.0f}%)")
+            print(f"  {section}.{stage:14} " + "  ".join(deltas))
+    old_rss = baseline.get("memory", {}).get("peak_rss_mb")
+    if old_rss:
+        print(f"  peak RSS {old_rss:.0f} -> {report['memory']['peak_rss_mb']:.0f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, index loading and queries")
+    parser.add_argument("--docs", type=int, default=20, help="PDFs in the synthetic corpus")
+    parser.add_argument("--pages", type=int, default=5, help="pages per PDF")
+    parser.add_argument("--builds", type=int, default=3, help="cold index builds")
+    parser.add_argument("--loads", type=int, default=10, help="index loads from disk")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=5, help="queries excluded from the statistics")
+    parser.add_argument("--llm-latency-ms", type=float, default=50, help="stub LLM latency")
+    parser.add_argument("--workdir", default="benchmark_run", help="corpus and caches go here (deleted first)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--compare", help="baseline report to compare against")
+    parser.add_argument("--verbose", action="store_true", help="show pipeline logs")
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir)
+    json_path = os.path.abspath(args.json) if args.json else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    os.chdir(workdir)  # the pipeline's faiss_cache/ and chat_history/ live here
+
+    start = time.perf_counter()
+    pdfs, facts = generate_corpus("data", args.docs, args.pages, seed=args.seed)
+    corpus = {
+        "docs": args.docs,
+        "pages": args.docs * args.pages,
+        "bytes": sum(os.path.getsize(p) for p in pdfs),
+        "generate_s": time.perf_counter() - start,
+    }
+    print(f"[INFO] Generated {corpus['docs']} PDFs / {corpus['pages']} pages in {corpus['generate_s']:.1f}s")
+
+    from embedding_service import EMBEDDING_MODEL, get_embedding_service
+    start = time.perf_counter()
+    with quiet(args.verbose):
+        get_embedding_service(EMBEDDING_MODEL).embed_query("warm up")
+    model_load_s = time.perf_counter() - start
+    memory = {"rss_after_model_load_mb": rss_mb()}
+
+    ingest, chunks = bench_ingest(pdfs, args.builds, args.verbose)
+    corpus["chunks"] = chunks
+    memory["rss_after_ingest_mb"] = rss_mb()
+    load = bench_load(pdfs, args.loads, args.verbose)
+    questions = [facts[i % len(facts)] for i in range(args.queries + args.warmup)]
+    query = bench_queries(pdfs, questions, args.warmup, args.llm_latency_ms, args.verbose)
+    memory["rss_after_queries_mb"] = rss_mb()
+    memory["peak_rss_mb"] = peak_rss_mb()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+            "model_load_s": model_load_s,
+        },
+        "corpus": corpus,
+        "ingest": ingest,
+        "load": load,
+        "query": query,
+        "memory": memory,
+    }
+
+    print(f"[INFO] {chunks} chunks, embedding model loaded in {model_load_s:.1f}s")
+    print_section(f"Ingestion ({args.builds} cold builds)", ingest)
+    print_section(f"Index load ({args.loads} loads)", load)
+    print_section(f"Queries ({args.queries}, stub LLM {args.llm_latency_ms:.0f}ms)", query)
+    print(f"\nPeak RSS {memory['peak_rss_mb']:.0f}MB")
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Report written to {json_path}")
+    if baseline_path:
+        with open(baseline_path) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,116 @@
 import os
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager
 from dotenv import load_dotenv
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from llm_client import LLMBackend
+from metrics import counter, gauge, record_span
 
 load_dotenv()
 
-class ChatGemini:
+
+class _Slots:
+    """
+    Counting semaphore shared by threads and event loops. A thread blocks
+    in acquire(); a coroutine awaits acquire_async() without tying up an
+    executor thread. Freed slots go to the waiters in arrival order.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._used = 0
+        self._waiters = deque()  # threading.Event of a waiting thread, or (loop, future) of a coroutine
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._used < self.limit and not self._waiters:
+                self._used += 1
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        event.wait()  # release() handed its slot over
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._used < self.limit and not self._waiters:
+                self._used += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter not in self._waiters
+                if not granted:
+                    self._waiters.remove(waiter)
+            if granted:
+                self.release()  # the slot was already handed over; pass it on
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                if not self._used:
+                    raise ValueError("Slot released too many times")
+                self._used -= 1
+                return
+            waiter = self._waiters.popleft()
+        # the slot goes straight to the waiter, so the count stays the same
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+            return
+        loop, future = waiter
+        try:
+            loop.call_soon_threadsafe(_grant, future)
+        except RuntimeError:  # its event loop is closed
+            self.release()
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def _grant(future):
+    if not future.done():  # a cancelled waiter gives the slot back itself
+        future.set_result(None)
+
+
+# Process-wide cap on in-flight Gemini calls, shared by every session and code path
+_gemini_slots = _Slots(int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")))
+
+
+@contextmanager
+def _track(method):
+    """Count, time and gauge one Gemini request (no contextvars, so it is safe across generator yields)"""
+    inflight = gauge("gemini_inflight_requests", "Gemini requests in flight")
+    inflight.inc()
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    except GeneratorExit:
+        outcome = "cancelled"  # the reader stopped a stream early
+        raise
+    finally:
+        inflight.dec()
+        record_span(f"gemini.{method}", time.perf_counter() - start)
+        counter("gemini_requests_total", "Gemini API requests", ["method", "outcome"]).inc(method=method, outcome=outcome)
+
+class ChatGemini(LLMBackend):
+    """Gemini backend. Raises on errors; wrap it with llm_client.get_llm() for retries."""
+
+    name = "gemini"
+
     def __init__(self):
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
@@ -14,12 +120,39 @@ class ChatGemini:
         # ⚠️ Fix is here: Updated to the current, supported model name.
         self.model = genai.GenerativeModel("gemini-2.5-flash") 
 
-    def get_response(self, prompt):
-        try:
-            # The generate_content method is correct for the Python SDK
-            response = self.model.generate_content(prompt) 
+    @staticmethod
+    def _options(timeout):
+        return {"timeout": timeout} if timeout else None
+
+    def is_retryable(self, error):
+        # rate limiting, server errors and timeouts are transient; other 4xx (bad key, blocked prompt) are not
+        if isinstance(error, (google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted,
+                              google_exceptions.RequestTimeout)):
+            return True
+        return not isinstance(error, (google_exceptions.ClientError, ValueError))
+
+    def generate(self, prompt, timeout=None):
+        with _gemini_slots, _track("generate"):
+            response = self.model.generate_content(prompt, request_options=self._options(timeout))
             return response.text
-        except Exception as e:
-            # It's better to catch the specific API error for better debugging, 
-            # but this general catch is fine for now.
-            return f"⚠️ Gemini API Error: {e}"
\ No newline at end of file
+
+    async def agenerate(self, prompt, timeout=None):
+        """Waits for a free slot on the event loop itself, without holding an executor thread"""
+        await _gemini_slots.acquire_async()
+        try:
+            with _track("agenerate"):
+                response = await self.model.generate_content_async(prompt, request_options=self._options(timeout))
+                return response.text
+        finally:
+            _gemini_slots.release()
+
+    def generate_stream(self, prompt, timeout=None):
+        """Yield the response text chunk by chunk as Gemini produces it"""
+        with _gemini_slots, _track("stream"):
+            for chunk in self.model.generate_content(prompt, stream=True, request_options=self._options(timeout)):
+                try:
+                    text = chunk.text
+                except ValueError:
+                    continue  # e.g. a final chunk carrying only the finish reason
+                if text:
+                    yield text
@@ -0,0 +1,177 @@
+import json
+import sqlite3
+import threading
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore, AddableMixin
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    LangChain docstore backed by SQLite.
+
+    Chunk text is only read when FAISS returns its id, so loading an index
+    no longer deserializes every chunk. The same database also holds the
+    per-document manifest, the FAISS position -> chunk id map, the
+    deduplication entries of stored chunks and the references of
+    duplicate chunks to the one stored copy.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                id TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS index_map (
+                pos INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_hash TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                chunk_ids TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunk_dedup (
+                chunk_id TEXT PRIMARY KEY,
+                text_hash TEXT NOT NULL,
+                signature BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunk_refs (
+                chunk_id TEXT NOT NULL,
+                doc_hash TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunk_refs_chunk ON chunk_refs (chunk_id);
+            CREATE INDEX IF NOT EXISTS chunk_refs_doc ON chunk_refs (doc_hash);
+        """)
+        self.conn.commit()
+
+    # --- Docstore interface ---
+
+    def add(self, texts):
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, content, metadata) VALUES (?, ?, ?)",
+                [(id_, doc.page_content, json.dumps(doc.metadata)) for id_, doc in texts.items()],
+            )
+
+    def search(self, search):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT content, metadata FROM chunks WHERE id = ?", (search,)
+            ).fetchone()
+            refs = self.conn.execute(
+                "SELECT metadata FROM chunk_refs WHERE chunk_id = ?", (search,)
+            ).fetchall()
+        if row is None:
+            return f"ID {search} not found."
+        metadata = json.loads(row[1])
+        if refs:
+            # other places the same (or nearly the same) chunk was found
+            metadata["duplicate_sources"] = [
+                {k: ref.get(k) for k in ("source", "page")} for ref in (json.loads(r[0]) for r in refs)
+            ]
+        return Document(id=search, page_content=row[0], metadata=metadata)
+
+    def delete(self, ids):
+        with self._lock:
+            params = [(i,) for i in ids]
+            self.conn.executemany("DELETE FROM chunks WHERE id = ?", params)
+            self.conn.executemany("DELETE FROM chunk_dedup WHERE chunk_id = ?", params)
+            self.conn.executemany("DELETE FROM chunk_refs WHERE chunk_id = ?", params)
+
+    def iter_chunks(self, batch_size=1000):
+        """Yield ([ids], [texts]) batches of every stored chunk"""
+        with self._lock:
+            rows = self.conn.execute("SELECT id, content FROM chunks").fetchall()
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i:i + batch_size]
+            yield [r[0] for r in batch], [r[1] for r in batch]
+
+    # --- Deduplication ---
+
+    def load_dedup_entries(self):
+        """Return [(chunk_id, text_hash, minhash signature bytes)] of the stored chunks"""
+        with self._lock:
+            return self.conn.execute("SELECT chunk_id, text_hash, signature FROM chunk_dedup").fetchall()
+
+    def add_dedup_entries(self, entries):
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO chunk_dedup (chunk_id, text_hash, signature) VALUES (?, ?, ?)", entries)
+
+    def add_references(self, refs):
+        """Record [(chunk_id, doc_hash, metadata)] duplicates that map to a stored chunk"""
+        with self._lock:
+            self.conn.executemany(
+                "INSERT INTO chunk_refs (chunk_id, doc_hash, metadata) VALUES (?, ?, ?)",
+                [(chunk_id, doc_hash, json.dumps(metadata)) for chunk_id, doc_hash, metadata in refs],
+            )
+
+    def delete_references(self, doc_hashes):
+        with self._lock:
+            self.conn.executemany("DELETE FROM chunk_refs WHERE doc_hash = ?", [(h,) for h in doc_hashes])
+
+    def promote_references(self, chunk_ids):
+        """
+        Make each chunk's oldest remaining reference its primary source,
+        for chunks whose own document was removed while duplicates remain.
+        """
+        with self._lock:
+            for chunk_id in chunk_ids:
+                row = self.conn.execute(
+                    "SELECT rowid, metadata FROM chunk_refs WHERE chunk_id = ? ORDER BY rowid LIMIT 1", (chunk_id,)
+                ).fetchone()
+                if row is None:
+                    continue
+                self.conn.execute("UPDATE chunks SET metadata = ? WHERE id = ?", (row[1], chunk_id))
+                self.conn.execute("DELETE FROM chunk_refs WHERE rowid = ?", (row[0],))
+
+    # --- Manifest and id map ---
+
+    def load_manifest(self):
+        """Return {doc_hash: {"source": path, "ids": [chunk ids]}}"""
+        with self._lock:
+            rows = self.conn.execute("SELECT doc_hash, source, chunk_ids FROM documents").fetchall()
+        return {h: {"source": src, "ids": json.loads(ids)} for h, src, ids in rows}
+
+    def load_index_map(self):
+        with self._lock:
+            rows = self.conn.execute("SELECT pos, chunk_id FROM index_map").fetchall()
+        return dict(rows)
+
+    def save(self, manifest, index_to_docstore_id):
+        """Replace the manifest and id map and commit pending chunk changes"""
+        with self._lock:
+            self.conn.execute("DELETE FROM documents")
+            self.conn.executemany(
+                "INSERT INTO documents (doc_hash, source, chunk_ids) VALUES (?, ?, ?)",
+                [(h, d["source"], json.dumps(d["ids"])) for h, d in manifest.items()],
+            )
+            self.conn.execute("DELETE FROM index_map")
+            self.conn.executemany(
+                "INSERT INTO index_map (pos, chunk_id) VALUES (?, ?)",
+                index_to_docstore_id.items(),
+            )
+            self.conn.commit()
+
+    def rollback(self):
+        """Discard chunk and manifest changes made since the last save()"""
+        with self._lock:
+            self.conn.rollback()
+
+    def clear(self):
+        with self._lock:
+            self.conn.executescript("DELETE FROM chunks; DELETE FROM index_map; DELETE FROM documents; "
+                                    "DELETE FROM chunk_dedup; DELETE FROM chunk_refs;")
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
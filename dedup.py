@@ -0,0 +1,179 @@
+import os
+import re
+import zlib
+import hashlib
+from collections import Counter, defaultdict
+import numpy as np
+from langchain_core.documents import Document
+from metrics import counter
+
+_WORD = re.compile(r"\w+")
+
+
+def _normalize_line(line):
+    # page numbers and dates vary from page to page of the same header
+    return re.sub(r"\d+", "#", " ".join(line.lower().split()))
+
+
+def strip_repeated_lines(pages, edge_lines=3, min_share=0.5, min_pages=3):
+    """
+    Remove headers and footers repeated across one document's pages: a
+    line among the first or last `edge_lines` of a page that (digits
+    aside) appears there on at least `min_share` of the pages. Returns new
+    page Documents and the number of lines removed.
+    """
+    if len(pages) < min_pages:
+        return pages, 0
+    seen = Counter()
+    for page in pages:
+        lines = [l for l in page.page_content.splitlines() if l.strip()]
+        edges = lines[:edge_lines] + lines[-edge_lines:]
+        seen.update({_normalize_line(l) for l in edges})
+    repeated = {line for line, n in seen.items() if n >= max(2, min_share * len(pages))}
+    if not repeated:
+        return pages, 0
+
+    stripped, removed = [], 0
+    for page in pages:
+        lines = page.page_content.splitlines()
+        content = [i for i, l in enumerate(lines) if l.strip()]
+        edges = set(content[:edge_lines] + content[-edge_lines:])
+        kept = [l for i, l in enumerate(lines) if i not in edges or _normalize_line(l) not in repeated]
+        removed += len(lines) - len(kept)
+        stripped.append(Document(page_content="\n".join(kept), metadata=page.metadata))
+    return stripped, removed
+
+
+def _mix64(x):
+    """splitmix64 finalizer: a bijective 64-bit mixing hash (uint64 arithmetic wraps)"""
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class MinHasher:
+    """
+    MinHash signatures over word shingles; stable across processes (crc32 +
+    fixed seed). Permutation i hashes shingle h as mix64(h ^ seed_i) with
+    independent 64-bit seeds, so the minima of different permutations
+    fall on unrelated shingles and the share of equal minima estimates
+    the Jaccard similarity.
+    """
+
+    def __init__(self, num_perm=64, shingle_size=5, seed=1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seeds = np.frombuffer(rng.bytes(8 * num_perm), dtype=np.uint64).copy()
+
+    def signature(self, text):
+        words = _WORD.findall(text.lower())
+        k = self.shingle_size
+        shingles = {" ".join(words[i:i + k]) for i in range(max(len(words) - k + 1, 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        with np.errstate(over="ignore"):
+            return _mix64(_mix64(hashes)[:, None] ^ self.seeds).min(axis=0)
+
+
+class Deduplicator:
+    """
+    Maps each new chunk to an already stored chunk with the same text
+    (exact hash of the whitespace/case-normalized text) or nearly the same
+    text (MinHash/LSH, estimated Jaccard similarity of word 5-shingles >=
+    `threshold`). Only chunks without a match are embedded and indexed.
+
+    Entries of stored chunks are persisted in the namespace's chunk store
+    (see SQLiteDocstore.load_dedup_entries); `new_entries` are the ones
+    added since loading.
+    """
+
+    def __init__(self, threshold=None, num_perm=64, band_rows=8, strip_boilerplate=None):
+        self.threshold = threshold or float(os.getenv("DEDUP_THRESHOLD", "0.9"))
+        self.strip_boilerplate = (strip_boilerplate if strip_boilerplate is not None
+                                  else os.getenv("DEDUP_STRIP_BOILERPLATE", "1") == "1")
+        self.hasher = MinHasher(num_perm)
+        self.band_rows = band_rows
+        self._exact = {}
+        self._signatures = {}
+        self._buckets = defaultdict(list)
+        self.new_entries = []
+        self.stats = {"unique": 0, "exact": 0, "near": 0, "boilerplate_lines": 0}
+
+    @classmethod
+    def load(cls, docstore, stored_chunks=None, **kwargs):
+        """
+        Deduplicator seeded with the chunks already in `docstore`. Chunks
+        stored before deduplication existed get their entries computed
+        (skipped when the entries already cover `stored_chunks` chunks).
+        """
+        dedup = cls(**kwargs)
+        for chunk_id, text_hash, signature in docstore.load_dedup_entries():
+            # entries stored by an older hash scheme (32-bit signatures) are recomputed below
+            if len(signature) == dedup.hasher.num_perm * 8:
+                dedup._register(chunk_id, text_hash, np.frombuffer(signature, dtype=np.uint64))
+        if stored_chunks is not None and len(dedup._signatures) >= stored_chunks:
+            return dedup
+        for ids, texts in docstore.iter_chunks():
+            for chunk_id, text in zip(ids, texts):
+                if chunk_id not in dedup._signatures:
+                    dedup.add(chunk_id, text)
+        return dedup
+
+    @staticmethod
+    def _text_hash(text):
+        return hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).hexdigest()
+
+    def _bands(self, signature):
+        rows = self.band_rows
+        return [(i, signature[i * rows:(i + 1) * rows].tobytes()) for i in range(len(signature) // rows)]
+
+    def _register(self, chunk_id, text_hash, signature):
+        self._exact.setdefault(text_hash, chunk_id)
+        self._signatures[chunk_id] = signature
+        for band in self._bands(signature):
+            self._buckets[band].append(chunk_id)
+
+    def add(self, chunk_id, text):
+        text_hash, signature = self._text_hash(text), self.hasher.signature(text)
+        self._register(chunk_id, text_hash, signature)
+        self.new_entries.append((chunk_id, text_hash, signature.tobytes()))
+
+    def strip(self, pages):
+        """Strip repeated headers/footers from one document's pages (if enabled)"""
+        if not self.strip_boilerplate:
+            return pages
+        pages, removed = strip_repeated_lines(pages)
+        self.stats["boilerplate_lines"] += removed
+        return pages
+
+    def check(self, chunk_id, text):
+        """
+        Return the id of the stored chunk `text` duplicates, or `chunk_id`
+        itself after registering it as a new unique chunk.
+        """
+        text_hash = self._text_hash(text)
+        canonical = self._exact.get(text_hash)
+        if canonical is not None:
+            self.stats["exact"] += 1
+            return canonical
+        signature = self.hasher.signature(text)
+        candidates = {c for band in self._bands(signature) for c in self._buckets.get(band, ())}
+        best, best_similarity = None, self.threshold
+        for candidate in candidates:
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        if best is not None:
+            self.stats["near"] += 1
+            return best
+        self._register(chunk_id, text_hash, signature)
+        self.new_entries.append((chunk_id, text_hash, signature.tobytes()))
+        self.stats["unique"] += 1
+        return chunk_id
+
+    def record_metrics(self):
+        chunks = counter("dedup_chunks_total", "Ingested chunks by deduplication result", ["result"])
+        for result in ("unique", "exact", "near"):
+            chunks.inc(self.stats[result], result=result)
+        counter("boilerplate_lines_stripped_total", "Repeated header/footer lines removed").inc(
+            self.stats["boilerplate_lines"])
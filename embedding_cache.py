@@ -0,0 +1,189 @@
+import os
+import fcntl
+import hashlib
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+KEY_SIZE = 32  # sha256 digest bytes
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed store of chunk embeddings.
+
+    Vectors live in an append-only float32 matrix (vectors.f32) that is
+    memory-mapped for reads; keys.bin holds one sha256(model, text) digest
+    per row in the same order. The keys are only read into memory by the
+    first lookup, so opening the cache (e.g. to load an index that needs
+    no embedding) costs nothing; get_embedding_cache() shares one instance
+    per directory and model across the process.
+    """
+
+    def __init__(self, cache_dir, model_name):
+        self.model_name = model_name
+        slug = model_name.replace("/", "__")
+        self.dir = os.path.join(cache_dir, slug)
+        os.makedirs(self.dir, exist_ok=True)
+        self.vectors_file = os.path.join(self.dir, "vectors.f32")
+        self.keys_file = os.path.join(self.dir, "keys.bin")
+        self.dim_file = os.path.join(self.dir, "dim")
+        self._open()
+
+    def _open(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._matrix = None
+        self.dim = None
+        if os.path.exists(self.dim_file):
+            with open(self.dim_file) as f:
+                self.dim = int(f.read().strip())
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for field in ("_lock", "_rows", "_matrix", "hits", "misses"):
+            state.pop(field, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).digest()
+
+    def _refresh(self):
+        """Pick up rows appended since the last read (possibly by another process)"""
+        if self.dim is None or not os.path.exists(self.keys_file):
+            return
+        row_bytes = self.dim * 4
+        n_vectors = os.path.getsize(self.vectors_file) // row_bytes if os.path.exists(self.vectors_file) else 0
+        n_keys = os.path.getsize(self.keys_file) // KEY_SIZE
+        # keys are written after their vectors, so only rows with a key are complete
+        n = min(n_keys, n_vectors)
+        if n == len(self._rows):
+            return
+        with open(self.keys_file, "rb") as f:
+            f.seek(len(self._rows) * KEY_SIZE)
+            data = f.read((n - len(self._rows)) * KEY_SIZE)
+        start = len(self._rows)
+        for i in range(len(data) // KEY_SIZE):
+            self._rows.setdefault(data[i * KEY_SIZE:(i + 1) * KEY_SIZE], start + i)
+        self._matrix = np.memmap(self.vectors_file, dtype=np.float32, mode="r", shape=(n, self.dim))
+
+    def _drop_incomplete_rows(self):
+        """
+        Cut what an interrupted append left behind (vectors without a key, a
+        partial key), so the next append keeps row i paired with key i.
+        Called with the keys file locked.
+        """
+        n_keys = os.path.getsize(self.keys_file) // KEY_SIZE
+        vectors_size = os.path.getsize(self.vectors_file) if os.path.exists(self.vectors_file) else 0
+        n = min(n_keys, vectors_size // (self.dim * 4))
+        if os.path.getsize(self.keys_file) != n * KEY_SIZE:
+            os.truncate(self.keys_file, n * KEY_SIZE)
+        if vectors_size != n * self.dim * 4:
+            print(f"[WARNING] Embedding cache: dropping the incomplete tail of {self.vectors_file}")
+            os.truncate(self.vectors_file, n * self.dim * 4)
+
+    def get_many(self, keys):
+        """Return a list with a vector (or None) per key"""
+        with self._lock:
+            if any(k not in self._rows for k in keys):
+                self._refresh()
+            result = []
+            for k in keys:
+                row = self._rows.get(k)
+                if row is None:
+                    self.misses += 1
+                    result.append(None)
+                else:
+                    self.hits += 1
+                    result.append(np.array(self._matrix[row]))
+            return result
+
+    def put_many(self, keys, vectors):
+        """Append new (key, vector) pairs to the cache"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(keys):
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self.dim_file, "w") as f:
+                    f.write(str(self.dim))
+            with open(self.keys_file, "ab") as keys_f:
+                fcntl.flock(keys_f, fcntl.LOCK_EX)
+                try:
+                    self._drop_incomplete_rows()
+                    self._refresh()
+                    fresh = [i for i, k in enumerate(keys) if k not in self._rows]
+                    fresh = list({keys[i]: i for i in fresh}.values())
+                    if not fresh:
+                        return
+                    with open(self.vectors_file, "ab") as vec_f:
+                        vec_f.write(vectors[fresh].tobytes())
+                        vec_f.flush()
+                        os.fsync(vec_f.fileno())
+                    keys_f.write(b"".join(keys[i] for i in fresh))
+                    keys_f.flush()
+                finally:
+                    fcntl.flock(keys_f, fcntl.LOCK_UN)
+            self._refresh()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._rows),
+        }
+
+
+def get_embedding_cache(cache_dir, model_name):
+    """Return the process-wide EmbeddingCache for `model_name` under `cache_dir`"""
+    key = (os.path.abspath(cache_dir), model_name)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = EmbeddingCache(cache_dir, model_name)
+        return cache
+
+
+def clear_embedding_caches():
+    """Forget the process-wide caches, e.g. after their directory was deleted"""
+    with _caches_lock:
+        _caches.clear()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only runs the model on chunks missing from the cache"""
+
+    def __init__(self, embeddings, cache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        keys = [self.cache.key(t) for t in texts]
+        vectors = self.cache.get_many(keys)
+        missing = {}
+        for i, (k, v) in enumerate(zip(keys, vectors)):
+            if v is None:
+                missing.setdefault(k, []).append(i)
+        if missing:
+            todo = list(missing)
+            computed = self.embeddings.embed_documents([texts[missing[k][0]] for k in todo])
+            self.cache.put_many(todo, computed)
+            for k, vector in zip(todo, computed):
+                for i in missing[k]:
+                    vectors[i] = vector
+        return [np.asarray(v, dtype=np.float32).tolist() for v in vectors]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
@@ -0,0 +1,108 @@
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+class EmbeddingService(Embeddings):
+    """
+    Process-wide embedding model.
+
+    Document batches are encoded directly under a lock. Query embeddings
+    from concurrent sessions are queued and micro-batched: the batcher
+    thread waits up to `max_wait_ms` for up to `batch_size` queries and
+    encodes them in a single forward pass.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL, batch_size=None, max_wait_ms=None, torch_threads=None):
+        self.model_name = model_name
+        self.batch_size = batch_size or int(os.getenv("EMBED_BATCH_SIZE", "32"))
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else float(os.getenv("EMBED_MAX_WAIT_MS", "5"))) / 1000
+        torch_threads = torch_threads or int(os.getenv("EMBED_TORCH_THREADS", "0"))
+        if torch_threads:
+            import torch
+            torch.set_num_threads(torch_threads)
+        self.model = HuggingFaceEmbeddings(
+            model_name=model_name,
+            encode_kwargs={"batch_size": self.batch_size},
+        )
+        self._model_lock = threading.Lock()
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self._queries = queue.Queue()
+        self._batcher = threading.Thread(target=self._batch_queries, name="embed-batcher", daemon=True)
+        self._batcher.start()
+
+    def embed_documents(self, texts):
+        with self._model_lock:
+            return self.model.embed_documents(list(texts))
+
+    def embed_query(self, text):
+        with self._close_lock:
+            # queries queued before close() are still answered by the batcher
+            closed = self._closed
+            if not closed:
+                future = Future()
+                self._queries.put((text, future))
+        if closed:
+            return self.embed_documents([text])[0]
+        return future.result()
+
+    def close(self):
+        """Stop the batcher thread; later queries (from a stale reference) are encoded one at a time"""
+        with self._close_lock:
+            self._closed = True
+            self._queries.put(None)
+
+    def _batch_queries(self):
+        while True:
+            item = self._queries.get()
+            if item is None:
+                return
+            batch = [item]
+            try:
+                while len(batch) < self.batch_size:
+                    item = self._queries.get(timeout=self.max_wait)
+                    if item is None:
+                        self._queries.put(None)  # stop after this batch
+                        break
+                    batch.append(item)
+            except queue.Empty:
+                pass
+            try:
+                vectors = self.embed_documents([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+def get_embedding_service(model_name=EMBEDDING_MODEL):
+    """Return the shared EmbeddingService for `model_name`, loading it on first use"""
+    service = _services.get(model_name)
+    if service is None:
+        with _services_lock:
+            service = _services.get(model_name)
+            if service is None:
+                print(f"[INFO] Loading embedding model {model_name}...")
+                service = EmbeddingService(model_name)
+                _services[model_name] = service
+    return service
+
+
+def release_embedding_service(model_name=EMBEDDING_MODEL):
+    """Unload the shared EmbeddingService for `model_name`; the next get_embedding_service reloads it"""
+    with _services_lock:
+        service = _services.pop(model_name, None)
+    if service is not None:
+        service.close()
+        print(f"[INFO] Unloaded embedding model {model_name}")
@@ -1,19 +1,131 @@
-import json, os
+import json, os, fcntl, threading
+from metrics import counter, span
 
 class HistoryManager:
+    """
+    Append-only chat history stored as one JSON object per line.
+
+    Each turn is appended with a single locked write, so saving is O(1)
+    and concurrent writers cannot interleave partial lines. Loaded turns
+    are cached in memory together with the file offset they were read
+    up to; later loads only parse lines appended since then.
+    """
+
     def __init__(self, session_id):
-        self.file_path = f"chat_history/{session_id}.json"
+        self.file_path = f"chat_history/{session_id}.jsonl"
         os.makedirs("chat_history", exist_ok=True)
+        legacy_path = f"chat_history/{session_id}.json"
+        if not os.path.exists(self.file_path) and os.path.exists(legacy_path):
+            self._migrate(legacy_path)
         if not os.path.exists(self.file_path):
-            with open(self.file_path, 'w') as f:
-                json.dump([], f)
+            open(self.file_path, 'a').close()
+        self._lock = threading.Lock()
+        self._turns = None  # cached turns, None until the first full load
+        self._offset = 0    # bytes of the file covered by self._turns
+        self._count = 0
+        self._count_offset = 0
+
+    def _migrate(self, legacy_path):
+        """Convert a pre-JSONL history file, writing the new file atomically"""
+        with open(legacy_path, 'r') as f:
+            turns = json.load(f)
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            for turn in turns:
+                f.write(json.dumps(turn) + "\n")
+        os.replace(tmp_path, self.file_path)
+        os.remove(legacy_path)
+
+    @staticmethod
+    def _parse(data):
+        """Parse complete lines, skipping a torn final line from a crashed writer"""
+        turns = []
+        for line in data.splitlines():
+            try:
+                turns.append(json.loads(line))
+            except ValueError:
+                continue
+        return turns
+
+    def _sync(self):
+        """Read lines appended since the last load (by this or another process)"""
+        with open(self.file_path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1  # only consume complete lines
+        if self._turns is None:
+            self._turns = []
+        self._turns.extend(self._parse(data[:end]))
+        self._offset += end
+
+    def _read_tail(self, last_n, block_size=8192):
+        """Return the last `last_n` turns by scanning backwards from the end of the file"""
+        with open(self.file_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            data = b""
+            while pos > 0 and data.count(b"\n") <= last_n:
+                step = min(block_size, pos)
+                pos -= step
+                f.seek(pos)
+                data = f.read(step) + data
+        lines = data.splitlines()
+        if pos > 0:
+            lines = lines[1:]  # first line may be cut in half
+        return self._parse(b"\n".join(lines[-last_n:]))
+
+    def load_history(self, last_n=None):
+        """Return all turns, or only the last `last_n` turns"""
+        with span("history.load"), self._lock:
+            if last_n is not None and self._turns is None:
+                return self._read_tail(last_n) if last_n > 0 else []
+            self._sync()
+            turns = self._turns if last_n is None else self._turns[-last_n:] if last_n > 0 else []
+            return list(turns)
+
+    def count(self):
+        """Return the number of saved turns, counting only newly appended lines"""
+        with self._lock:
+            with open(self.file_path, 'rb') as f:
+                f.seek(self._count_offset)
+                data = f.read()
+            end = data.rfind(b"\n") + 1
+            self._count += data.count(b"\n", 0, end)
+            self._count_offset += end
+            return self._count
+
+    def save_turn(self, role, content):
+        line = (json.dumps({"role": role, "content": content}) + "\n").encode("utf-8")
+        with span("history.append"), self._lock:
+            with open(self.file_path, 'ab') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.write(line)
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        counter("history_turns_written_total", "Chat turns appended to history files", ["role"]).inc(role=role)
+
+
+class EphemeralHistory:
+    """In-memory chat history for a one-off session; nothing is written to disk"""
+
+    file_path = None
+
+    def __init__(self):
+        self.summary = {"covered": 0, "text": ""}  # the rolling summary, kept here instead of a file
+        self._turns = []
+        self._lock = threading.Lock()
+
+    def load_history(self, last_n=None):
+        with self._lock:
+            turns = self._turns if last_n is None else self._turns[-last_n:] if last_n > 0 else []
+            return list(turns)
 
-    def load_history(self):
-        with open(self.file_path, 'r') as f:
-            return json.load(f)
+    def count(self):
+        with self._lock:
+            return len(self._turns)
 
     def save_turn(self, role, content):
-        history = self.load_history()
-        history.append({"role": role, "content": content})
-        with open(self.file_path, 'w') as f:
-            json.dump(history, f, indent=2)
+        with self._lock:
+            self._turns.append({"role": role, "content": content})
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Import-time budget of the Streamlit app.
+
+Module-level imports of app.py are what every cold start pays before the
+first paint; imports nested in blocks are deferred to first use / the
+background warm-up. Each set is imported in a fresh interpreter under
+`python -X importtime`, and the report compares "before" (everything
+imported up front) with "after" (only the eager set).
+
+    python import_profile.py --top 15 --json import_profile.json
+"""
+
+import os
+import ast
+import sys
+import json
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def app_imports(path):
+    """Return (eager, deferred) top-level module names imported by a script"""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    eager = []
+    for node in tree.body:
+        eager.extend(_modules(node))
+    deferred = []
+    for node in ast.walk(tree):
+        if node not in tree.body:
+            deferred.extend(m for m in _modules(node) if m not in eager and m not in deferred)
+    return list(dict.fromkeys(eager)), deferred
+
+
+def _modules(node):
+    if isinstance(node, ast.Import):
+        return [alias.name for alias in node.names]
+    if isinstance(node, ast.ImportFrom) and node.module and not node.level:
+        return [node.module]
+    return []
+
+
+def profile(modules):
+    """Import `modules` in a fresh interpreter; return (total seconds, {package: cumulative seconds})"""
+    code = "; ".join(f"import {m}" for m in modules)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True, cwd=HERE)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.startswith("  "):
+            continue  # nested import, already counted in its parent's cumulative time
+        packages[name.strip()] = int(cumulative) / 1e6
+    return sum(packages.values()), packages
+
+
+def print_top(title, total, packages, top):
+    print(f"\n{title}: {total:.2f}s")
+    for name, seconds in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {seconds:7.3f}s  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time profile of app.py's startup")
+    parser.add_argument("--app", default=os.path.join(HERE, "app.py"))
+    parser.add_argument("--top", type=int, default=10, help="heaviest imports to list")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    eager, deferred = app_imports(args.app)
+    print(f"[INFO] Eager imports: {', '.join(eager)}")
+    print(f"[INFO] Deferred imports: {', '.join(deferred) or '(none)'}")
+
+    after_total, after = profile(eager)
+    before_total, before = profile(eager + deferred)
+    print_top("Before (all imports at startup)", before_total, before, args.top)
+    print_top("After (eager imports only, before first paint)", after_total, after, args.top)
+    print(f"\nStartup import budget: {before_total:.2f}s -> {after_total:.2f}s "
+          f"({before_total - after_total:.2f}s moved to the background warm-up)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "eager": eager,
+                "deferred": deferred,
+                "before_s": before_total,
+                "after_s": after_total,
+                "before": before,
+                "after": after,
+            }, f, indent=2)
+        print(f"[INFO] Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from ingestion import IngestionCancelled
+from metrics import counter, gauge, histogram
+
+FILE_STAGES = ("queued", "parsed", "split", "embedding", "indexed")
+# share of a file's work done on reaching each stage, for the overall progress fraction
+_STAGE_WEIGHTS = {"queued": 0.0, "parsed": 0.2, "split": 0.3, "embedding": 0.3, "indexed": 1.0}
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+class IngestJob:
+    """
+    One background index build: its status (queued, running, done, failed
+    or cancelled), the stage each PDF has reached and a cancel event. The
+    stage callbacks come from the ingestion threads; progress() returns a
+    consistent snapshot for display.
+    """
+
+    def __init__(self, pdf_files):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.status = "queued"
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._files = {pdf: {"stage": "queued"} for pdf in pdf_files}
+
+    def update(self, pdf_file, stage, **counts):
+        """Progress callback: record that `pdf_file` reached `stage` (see FILE_STAGES)"""
+        with self._lock:
+            entry = self._files.setdefault(pdf_file, {})
+            # stages can be reported out of order across threads; never move a file backwards
+            if FILE_STAGES.index(stage) >= FILE_STAGES.index(entry.get("stage", "queued")):
+                entry["stage"] = stage
+            entry.update(counts)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def wait(self, timeout=None):
+        """Block until the job finishes; returns False on timeout"""
+        return self._done.wait(timeout)
+
+    def progress(self):
+        """
+        Return {job_id, status, error, elapsed_s, documents_ready,
+        documents_total, fraction, files: {pdf: {stage, pages, chunks, unique, embedded}}}
+        """
+        with self._lock:
+            files = {pdf: dict(entry) for pdf, entry in self._files.items()}
+        ready = sum(1 for entry in files.values() if entry["stage"] == "indexed")
+        done = 0.0
+        for entry in files.values():
+            done += _STAGE_WEIGHTS[entry["stage"]]
+            if entry["stage"] == "embedding" and entry.get("unique"):
+                done += 0.7 * min(entry.get("embedded", 0) / entry["unique"], 1.0)
+        elapsed = ((self.finished or time.time()) - self.started) if self.started else 0.0
+        return {"job_id": self.job_id, "status": self.status, "error": self.error, "elapsed_s": elapsed,
+                "documents_ready": ready, "documents_total": len(files),
+                "fraction": done / len(files) if files else 1.0, "files": files}
+
+
+class IngestJobManager:
+    """
+    Runs index builds in background worker threads (INGEST_JOB_WORKERS,
+    default 1; parsing inside a build still uses the process pool) and
+    keeps the most recent jobs for lookup by id.
+    """
+
+    def __init__(self, workers=None, keep=100):
+        workers = workers or int(os.getenv("INGEST_JOB_WORKERS", "1"))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.keep = keep
+
+    def submit(self, pdf_files, build):
+        """Queue `build(job)` for the given PDFs and return its IngestJob at once"""
+        job = IngestJob(pdf_files)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            finished = [job_id for job_id, j in self._jobs.items() if not j.active]
+            for job_id in finished[:max(len(self._jobs) - self.keep, 0)]:
+                del self._jobs[job_id]
+        self._executor.submit(self._run, job, build)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _run(self, job, build):
+        running = gauge("ingest_jobs_running", "Background index builds in progress")
+        job.started = time.time()
+        try:
+            if job.cancel_event.is_set():
+                raise IngestionCancelled()
+            job.status = "running"
+            running.inc()
+            try:
+                build(job)
+            finally:
+                running.dec()
+            job.status = "done"
+        except IngestionCancelled:
+            job.status = "cancelled"
+            print(f"[INFO] Ingestion job {job.job_id} cancelled")
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            print(f"[ERROR] Ingestion job {job.job_id} failed: {e}")
+        finally:
+            job.finished = time.time()
+            counter("ingest_jobs_total", "Background index builds by outcome", ["status"]).inc(status=job.status)
+            histogram("ingest_job_seconds", "Duration of background index builds").observe(
+                job.finished - job.started)
+            job._done.set()
+
+
+def get_job_manager():
+    """Return the process-wide IngestJobManager"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = IngestJobManager()
+        return _manager
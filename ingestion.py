@@ -0,0 +1,229 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_community.document_loaders.parsers import PyPDFParser
+from langchain_core.documents.base import Blob
+
+_DONE = object()
+CANCEL_POLL_S = 0.5  # how often a build waiting on the parse pool checks for cancellation
+
+
+class IngestionCancelled(Exception):
+    """Raised by IngestionPipeline.run when its cancel event is set"""
+
+
+def _parse_pdf(doc_hash, pdf_file, data=None):
+    """Parse one PDF into page Documents, from `data` if its bytes are already in memory"""
+    start = time.perf_counter()
+    if data is not None:
+        pages = PyPDFParser().parse(Blob.from_data(bytes(data), path=pdf_file))
+    else:
+        pages = PyPDFLoader(pdf_file).load()
+    return doc_hash, pdf_file, pages, time.perf_counter() - start
+
+
+def _stop_pool(pool):
+    """Shut the pool down at once, killing workers still parsing PDFs nobody will read"""
+    terminate_workers = getattr(pool, "terminate_workers", None)  # Python 3.14+
+    if terminate_workers is not None:
+        terminate_workers()
+        return
+    processes = list((pool._processes or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+class IngestionPipeline:
+    """
+    Staged PDF ingestion: parse -> split -> dedup -> embed -> index.
+
+    PDFs are parsed across a process pool; pages are split as each PDF
+    arrives and chunks are queued in batches to an embedding thread, so
+    embedding overlaps with parsing. `on_batch(texts, vectors, metadatas, ids)`
+    is called from the embedding thread for every embedded batch.
+
+    With a `deduplicator` (dedup.Deduplicator), repeated headers/footers
+    are stripped from each PDF's pages before splitting, and chunks that
+    duplicate an already stored or queued chunk are not embedded: the
+    document's id list points at the stored chunk instead, and the
+    duplicate's (chunk id, doc hash, metadata) lands in `references`.
+    """
+
+    def __init__(self, embeddings, parse_workers=None, embed_batch_size=None,
+                 chunk_size=1000, chunk_overlap=200, deduplicator=None):
+        self.embeddings = embeddings
+        self.deduplicator = deduplicator
+        self.references = []
+        self.parse_workers = parse_workers or int(os.getenv("INGEST_PARSE_WORKERS", os.cpu_count() or 1))
+        self.embed_batch_size = embed_batch_size or int(os.getenv("INGEST_EMBED_BATCH_SIZE", "256"))
+        self.splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.timings = {}
+
+    def _parsed(self, jobs, buffers, cancelled):
+        """Yield parse results as they complete; raises IngestionCancelled while waiting on the pool"""
+        if self.parse_workers <= 1 or len(jobs) <= 1:
+            for doc_hash, pdf_file in jobs:
+                yield _parse_pdf(doc_hash, pdf_file, buffers.get(pdf_file))
+            return
+        # workers read the files themselves: pickling the buffers over would cost another copy
+        workers = min(self.parse_workers, len(jobs))
+        # spawn keeps torch/tokenizer threads of the parent out of the workers
+        ctx = multiprocessing.get_context("spawn")
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+        finished = False
+        try:
+            pending = {pool.submit(_parse_pdf, doc_hash, pdf_file) for doc_hash, pdf_file in jobs}
+            while pending:
+                # a large PDF can take a while: keep checking for cancellation meanwhile
+                if cancelled():
+                    raise IngestionCancelled()
+                done, pending = wait(pending, timeout=CANCEL_POLL_S, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            finished = True
+        finally:
+            if finished:
+                pool.shutdown()
+            else:
+                _stop_pool(pool)  # cancelled, or an error
+
+    def run(self, jobs, on_batch, buffers=None, progress=None, cancel=None):
+        """
+        Ingest [(doc_hash, pdf_file)] jobs. `buffers` optionally maps
+        pdf_file to its bytes already in memory, parsed without a disk read.
+        Returns {doc_hash: [chunk ids]} for every parsed PDF.
+
+        `progress(doc_hash, stage, **counts)` is called as each PDF is
+        "parsed" (pages), "split" (chunks, unique), "embedding" (embedded)
+        and finally "indexed"; each PDF's chunks are then flushed to the
+        embedder when it is split, so it becomes searchable as early as
+        possible. Setting the `cancel` event raises IngestionCancelled.
+        """
+        timings = {"parse": 0.0, "split": 0.0, "dedup": 0.0, "embed": 0.0, "index": 0.0}
+        batches = queue.Queue(maxsize=8)
+        errors = []
+        expected = {}  # chunk id prefix -> (doc_hash, unique chunks to index)
+        embedded = {}
+
+        def cancelled():
+            return cancel is not None and cancel.is_set()
+
+        def report(ids):
+            for prefix, n in Counter(id_.rsplit("-", 1)[0] for id_ in ids).items():
+                doc_hash, total = expected[prefix]
+                embedded[prefix] = embedded.get(prefix, 0) + n
+                progress(doc_hash, "embedding", embedded=embedded[prefix])
+                if embedded[prefix] >= total:
+                    progress(doc_hash, "indexed")
+
+        def embed_worker():
+            while True:
+                batch = batches.get()
+                if batch is _DONE:
+                    return
+                if errors or cancelled():
+                    continue
+                texts, metadatas, ids = batch
+                try:
+                    start = time.perf_counter()
+                    vectors = self.embeddings.embed_documents(texts)
+                    timings["embed"] += time.perf_counter() - start
+                    start = time.perf_counter()
+                    on_batch(texts, vectors, metadatas, ids)
+                    timings["index"] += time.perf_counter() - start
+                    if progress is not None:
+                        report(ids)
+                except Exception as e:
+                    errors.append(e)
+
+        def put(item):
+            while True:
+                if errors:
+                    raise errors[0]
+                if cancelled():
+                    raise IngestionCancelled()
+                try:
+                    batches.put(item, timeout=CANCEL_POLL_S)
+                    return
+                except queue.Full:
+                    pass
+
+        worker = threading.Thread(target=embed_worker, name="embed-worker", daemon=True)
+        wall_start = time.perf_counter()
+        worker.start()
+
+        doc_ids = {}
+        pending_texts, pending_metadatas, pending_ids = [], [], []
+        try:
+            for doc_hash, pdf_file, pages, parse_time in self._parsed(jobs, buffers or {}, cancelled):
+                if cancelled():
+                    raise IngestionCancelled()
+                timings["parse"] += parse_time
+                print(f"[INFO] {len(pages)} pages loaded from {pdf_file}")
+                if progress is not None:
+                    progress(doc_hash, "parsed", pages=len(pages))
+                start = time.perf_counter()
+                if self.deduplicator is not None:
+                    pages = self.deduplicator.strip(pages)
+                chunks = self.splitter.split_documents(pages)
+                timings["split"] += time.perf_counter() - start
+                ids = [f"{doc_hash[:16]}-{i}" for i in range(len(chunks))]
+                if self.deduplicator is not None:
+                    start = time.perf_counter()
+                    unique = []
+                    for n, (chunk, id_) in enumerate(zip(chunks, ids)):
+                        canonical = self.deduplicator.check(id_, chunk.page_content)
+                        if canonical == id_:
+                            unique.append((chunk, id_))
+                        else:
+                            ids[n] = canonical
+                            self.references.append((canonical, doc_hash, chunk.metadata))
+                    timings["dedup"] += time.perf_counter() - start
+                else:
+                    unique = list(zip(chunks, ids))
+                doc_ids[doc_hash] = list(dict.fromkeys(ids))
+                if progress is not None:
+                    expected[doc_hash[:16]] = (doc_hash, len(unique))
+                    progress(doc_hash, "split", chunks=len(chunks), unique=len(unique))
+                    if not unique:
+                        progress(doc_hash, "indexed")
+                for chunk, id_ in unique:
+                    pending_texts.append(chunk.page_content)
+                    pending_metadatas.append(chunk.metadata)
+                    pending_ids.append(id_)
+                    if len(pending_texts) >= self.embed_batch_size:
+                        put((pending_texts, pending_metadatas, pending_ids))
+                        pending_texts, pending_metadatas, pending_ids = [], [], []
+                if progress is not None and pending_texts:
+                    put((pending_texts, pending_metadatas, pending_ids))
+                    pending_texts, pending_metadatas, pending_ids = [], [], []
+            if pending_texts:
+                put((pending_texts, pending_metadatas, pending_ids))
+        finally:
+            batches.put(_DONE)
+            worker.join()
+        if errors:
+            raise errors[0]
+        if cancelled():
+            raise IngestionCancelled()
+
+        timings["total"] = time.perf_counter() - wall_start
+        self.timings = timings
+        n_chunks = sum(len(ids) for ids in doc_ids.values())
+        dedup = ""
+        if self.deduplicator is not None:
+            stats = self.deduplicator.stats
+            dedup = (f", dedup {timings['dedup']:.2f}s: {stats['exact']} exact + {stats['near']} near duplicates, "
+                     f"{stats['boilerplate_lines']} header/footer lines stripped")
+        print(f"[INFO] Ingested {len(doc_ids)} PDFs / {n_chunks} chunks in {timings['total']:.2f}s "
+              f"(parse {timings['parse']:.2f}s across {min(self.parse_workers, max(len(jobs), 1))} workers, "
+              f"split {timings['split']:.2f}s, embed {timings['embed']:.2f}s, index {timings['index']:.2f}s{dedup})")
+        return doc_ids
@@ -0,0 +1,143 @@
+import os
+import re
+import math
+import numpy as np
+
+# Words, plus identifiers such as "A-113.2" or "clause_4.1" kept whole
+_TOKEN_RE = re.compile(r"\w+(?:[-./:]\w+)*")
+
+
+def tokenize(text):
+    """Lowercase terms; compound identifiers are indexed whole and by their parts"""
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        terms.append(token)
+        if not token.isalnum():
+            terms.extend(part for part in re.split(r"[-./:_]", token) if part)
+    return terms
+
+
+class BM25Index:
+    """
+    Okapi BM25 over chunk ids, updated alongside the FAISS index.
+
+    Postings are kept per term as parallel (slot, term frequency) arrays.
+    Adding a batch appends to the touched terms; removing chunks compacts
+    the slots. On disk it is a single .npz: the vocabulary, concatenated
+    postings with per-term offsets, chunk lengths and ids.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._ids = []
+        self._slots = {}
+        self._lengths = np.zeros(0, dtype=np.int32)
+        self._postings = {}  # term -> (slots int32, tfs uint16)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, ids, texts):
+        batch = {}
+        lengths = []
+        for id_, text in zip(ids, texts):
+            if id_ in self._slots:
+                continue  # already indexed (e.g. re-added after a partial build)
+            slot = len(self._ids)
+            self._ids.append(id_)
+            self._slots[id_] = slot
+            terms = tokenize(text)
+            lengths.append(len(terms))
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, tf in counts.items():
+                entry = batch.setdefault(term, ([], []))
+                entry[0].append(slot)
+                entry[1].append(min(tf, 65535))
+        if not lengths:
+            return
+        self._lengths = np.concatenate([self._lengths, np.array(lengths, dtype=np.int32)])
+        for term, (slots, tfs) in batch.items():
+            slots, tfs = np.array(slots, dtype=np.int32), np.array(tfs, dtype=np.uint16)
+            if term in self._postings:
+                old_slots, old_tfs = self._postings[term]
+                slots, tfs = np.concatenate([old_slots, slots]), np.concatenate([old_tfs, tfs])
+            self._postings[term] = (slots, tfs)
+
+    def remove(self, ids):
+        removed = {self._slots[id_] for id_ in ids if id_ in self._slots}
+        if not removed:
+            return
+        keep = np.ones(len(self._ids), dtype=bool)
+        keep[list(removed)] = False
+        remap = np.cumsum(keep, dtype=np.int32) - 1
+        for term in list(self._postings):
+            slots, tfs = self._postings[term]
+            mask = keep[slots]
+            if mask.all():
+                self._postings[term] = (remap[slots], tfs)
+            elif mask.any():
+                self._postings[term] = (remap[slots[mask]], tfs[mask])
+            else:
+                del self._postings[term]
+        self._ids = [id_ for id_, k in zip(self._ids, keep) if k]
+        self._slots = {id_: slot for slot, id_ in enumerate(self._ids)}
+        self._lengths = self._lengths[keep]
+
+    def search(self, query, k):
+        """Return [(chunk id, score)] for the k best matching chunks"""
+        n = len(self._ids)
+        if n == 0:
+            return []
+        avg_length = max(float(self._lengths.mean()), 1.0)
+        norm = self.k1 * (1 - self.b + self.b * self._lengths / avg_length)
+        scores = np.zeros(n, dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term not in self._postings:
+                continue
+            slots, tfs = self._postings[term]
+            idf = math.log(1 + (n - len(slots) + 0.5) / (len(slots) + 0.5))
+            tf = tfs.astype(np.float32)
+            scores[slots] += idf * tf * (self.k1 + 1) / (tf + norm[slots])
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k)[:k]]
+        matched = matched[np.argsort(-scores[matched])]
+        return [(self._ids[i], float(scores[i])) for i in matched]
+
+    # --- Persistence ---
+
+    def save(self, path):
+        terms = list(self._postings)
+        sizes = np.array([len(self._postings[t][0]) for t in terms], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        empty_slots, empty_tfs = np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.uint16)
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            terms=np.frombuffer("\n".join(terms).encode(), dtype=np.uint8),
+            ids=np.frombuffer("\n".join(self._ids).encode(), dtype=np.uint8),
+            offsets=offsets,
+            slots=np.concatenate([self._postings[t][0] for t in terms]) if terms else empty_slots,
+            tfs=np.concatenate([self._postings[t][1] for t in terms]) if terms else empty_tfs,
+            lengths=self._lengths,
+            params=np.array([self.k1, self.b]),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        k1, b = data["params"]
+        index = cls(float(k1), float(b))
+        ids = data["ids"].tobytes().decode()
+        index._ids = ids.split("\n") if ids else []
+        index._slots = {id_: slot for slot, id_ in enumerate(index._ids)}
+        index._lengths = data["lengths"]
+        terms = data["terms"].tobytes().decode()
+        offsets, slots, tfs = data["offsets"], data["slots"], data["tfs"]
+        for i, term in enumerate(terms.split("\n") if terms else []):
+            index._postings[term] = (slots[offsets[i]:offsets[i + 1]], tfs[offsets[i]:offsets[i + 1]])
+        return index
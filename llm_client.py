@@ -0,0 +1,345 @@
+import os
+import time
+import random
+import hashlib
+import asyncio
+import threading
+from metrics import counter, gauge
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+class LLMError(Exception):
+    """An LLM call failed after all retries (or was refused by the circuit breaker)"""
+
+
+class LLMTimeoutError(LLMError, TimeoutError):
+    pass
+
+
+class CircuitOpenError(LLMError):
+    pass
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` requests per second with bursts of up
+    to `burst`. reserve() takes a token and returns how long the caller has
+    to wait before using it, so sync and async callers share one bucket.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and refuses calls
+    for `reset_timeout` seconds; then lets a single probe call through
+    (half-open) and closes again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, name="llm"):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "open":
+                remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    raise CircuitOpenError(f"LLM circuit open, retry in {remaining:.1f}s")
+                self._set_state("half_open")
+                return
+            if self.state == "half_open":
+                raise CircuitOpenError("LLM circuit half-open, probe call in flight")
+
+    def _set_state(self, state):
+        self.state = state
+        gauge("llm_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ["backend"]).set(
+            {"closed": 0, "half_open": 1, "open": 2}[state], backend=self.name)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self.state != "closed":
+                self._set_state("closed")
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"[WARNING] LLM circuit opened after {self._failures} consecutive failures")
+                self._set_state("open")
+                self._opened_at = time.monotonic()
+
+
+class LLMBackend:
+    """
+    A text generation backend. Implementations raise on failure and must
+    honour `timeout` (seconds) themselves; ResilientLLM adds retries,
+    rate limiting and the circuit breaker on top.
+    """
+
+    name = "backend"
+
+    def generate(self, prompt, timeout=None):
+        raise NotImplementedError
+
+    async def agenerate(self, prompt, timeout=None):
+        return await asyncio.to_thread(self.generate, prompt, timeout)
+
+    def generate_stream(self, prompt, timeout=None):
+        yield self.generate(prompt, timeout)
+
+    def is_retryable(self, error):
+        return True
+
+
+class LocalStubBackend(LLMBackend):
+    """
+    Offline stand-in for load tests and development. The answer is a
+    deterministic function of the prompt; latency is `latency_ms` (plus up
+    to `jitter` of it, also derived from the prompt) before the first token
+    and `tokens_per_s` while streaming. `failure_rate` injects errors from a
+    seeded generator to exercise retries and the circuit breaker.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency_ms=None, tokens_per_s=None, jitter=None, failure_rate=None,
+                 answer_tokens=None, seed=0):
+        self.latency_ms = latency_ms if latency_ms is not None else float(os.getenv("STUB_LLM_LATENCY_MS", "300"))
+        self.tokens_per_s = tokens_per_s if tokens_per_s is not None else float(os.getenv("STUB_LLM_TOKENS_PER_S", "200"))
+        self.jitter = jitter if jitter is not None else float(os.getenv("STUB_LLM_JITTER", "0.2"))
+        self.failure_rate = failure_rate if failure_rate is not None else float(os.getenv("STUB_LLM_FAILURE_RATE", "0"))
+        self.answer_tokens = answer_tokens or int(os.getenv("STUB_LLM_ANSWER_TOKENS", "60"))
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _plan(self, prompt):
+        """Return (first token delay, answer words) for the prompt"""
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        delay = self.latency_ms / 1000 * (1 + self.jitter * digest[0] / 255)
+        question = prompt.rsplit("Question:", 1)[-1].strip().splitlines()[0] if "Question:" in prompt else "summary"
+        context = prompt.split("Document Context:", 1)[-1].split()
+        words = [f"[stub {digest[:4].hex()}]", "Answer", "to:", *question.split()[:20], "—", "based", "on:"]
+        words += context[:max(self.answer_tokens - len(words), 0)]
+        with self._lock:
+            fail = self._random.random() < self.failure_rate
+        if fail:
+            raise RuntimeError("Injected stub LLM failure")
+        return delay, words
+
+    def _check_timeout(self, delay, timeout):
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise LLMTimeoutError(f"stub LLM did not answer within {timeout}s")
+
+    def generate(self, prompt, timeout=None):
+        delay, words = self._plan(prompt)
+        total = delay + len(words) / self.tokens_per_s if self.tokens_per_s else delay
+        self._check_timeout(total, timeout)
+        time.sleep(total)
+        return " ".join(words)
+
+    async def agenerate(self, prompt, timeout=None):
+        delay, words = self._plan(prompt)
+        total = delay + len(words) / self.tokens_per_s if self.tokens_per_s else delay
+        if timeout is not None and total > timeout:
+            await asyncio.sleep(timeout)
+            raise LLMTimeoutError(f"stub LLM did not answer within {timeout}s")
+        await asyncio.sleep(total)
+        return " ".join(words)
+
+    def generate_stream(self, prompt, timeout=None):
+        delay, words = self._plan(prompt)
+        self._check_timeout(delay, timeout)
+        time.sleep(delay)
+        for i, word in enumerate(words):
+            if i and self.tokens_per_s:
+                time.sleep(1 / self.tokens_per_s)
+            yield word if i == 0 else " " + word
+
+
+class ResilientLLM:
+    """
+    Wraps an LLMBackend with a per-call timeout, jittered exponential
+    backoff on retryable errors, a token-bucket rate limiter and a circuit
+    breaker. Exposes get_response / aget_response / stream, which return
+    the answer text or raise LLMError.
+    """
+
+    def __init__(self, backend, timeout=None, max_retries=None, backoff_base=None, backoff_max=None,
+                 rate_limiter=None, breaker=None):
+        self.backend = backend
+        self.timeout = timeout or float(os.getenv("LLM_TIMEOUT", "60"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("LLM_MAX_RETRIES", "3"))
+        self.backoff_base = backoff_base or float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+        self.backoff_max = backoff_max or float(os.getenv("LLM_BACKOFF_MAX", "20"))
+        self.rate_limiter = rate_limiter
+        self.breaker = breaker or CircuitBreaker()
+
+    def _backoff(self, attempt):
+        # "full jitter": uniform in [0, min(max, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _admit(self):
+        """Check the breaker and return the rate limiter wait in seconds"""
+        self.breaker.before_call()
+        return self.rate_limiter.reserve() if self.rate_limiter is not None else 0.0
+
+    def _record(self, error):
+        """Feed a failed call to the circuit breaker; return True if it is retryable"""
+        if isinstance(error, CircuitOpenError):
+            return False
+        retryable = isinstance(error, TimeoutError) or self.backend.is_retryable(error)
+        if retryable:
+            self.breaker.record_failure()
+        else:
+            # the service answered; a bad request says nothing about its health
+            self.breaker.record_success()
+        return retryable
+
+    def _failed(self, error, attempt):
+        """Record a failed attempt; return True if it should be retried"""
+        if self._record(error) and attempt < self.max_retries:
+            print(f"[WARNING] {self.backend.name} call failed (attempt {attempt + 1}), retrying: {error}")
+            counter("llm_retries_total", "LLM calls retried", ["backend"]).inc(backend=self.backend.name)
+            return True
+        return False
+
+    def _error(self, error):
+        counter("llm_failures_total", "LLM calls that failed after retries", ["backend", "error"]).inc(
+            backend=self.backend.name, error=type(error).__name__)
+        if isinstance(error, LLMError):
+            return error
+        if isinstance(error, TimeoutError):
+            return LLMTimeoutError(str(error))
+        return LLMError(f"{type(error).__name__}: {error}")
+
+    def get_response(self, prompt):
+        attempt = 0
+        while True:
+            try:
+                wait = self._admit()
+                if wait:
+                    time.sleep(wait)
+                response = self.backend.generate(prompt, self.timeout)
+                self.breaker.record_success()
+                return response
+            except Exception as e:
+                if not self._failed(e, attempt):
+                    raise self._error(e) from e
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def aget_response(self, prompt):
+        attempt = 0
+        while True:
+            try:
+                wait = self._admit()
+                if wait:
+                    await asyncio.sleep(wait)
+                response = await asyncio.wait_for(self.backend.agenerate(prompt, self.timeout), self.timeout)
+                self.breaker.record_success()
+                return response
+            except asyncio.TimeoutError as e:
+                error = LLMTimeoutError(f"{self.backend.name} did not answer within {self.timeout}s")
+                if not self._failed(error, attempt):
+                    raise self._error(error) from e
+            except Exception as e:
+                if not self._failed(e, attempt):
+                    raise self._error(e) from e
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def stream(self, prompt):
+        """
+        Yield the answer in chunks. Failures before the first chunk are
+        retried; once text has been yielded an error is raised instead, so
+        the caller never sees a partial answer repeated.
+        """
+        attempt = 0
+        while True:
+            started = False
+            try:
+                wait = self._admit()
+                if wait:
+                    time.sleep(wait)
+                for chunk in self.backend.generate_stream(prompt, self.timeout):
+                    started = True
+                    yield chunk
+                self.breaker.record_success()
+                return
+            except GeneratorExit:
+                # the caller stopped reading; the backend was answering fine
+                self.breaker.record_success()
+                raise
+            except Exception as e:
+                if started:
+                    # text already went out, so this can never be retried
+                    self._record(e)
+                    raise self._error(e) from e
+                if not self._failed(e, attempt):
+                    raise self._error(e) from e
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+
+def _shared_guards(name):
+    """Return the process-wide (rate limiter, circuit breaker) for a backend"""
+    with _shared_lock:
+        if name not in _shared:
+            rate = float(os.getenv("LLM_RATE_LIMIT", "0"))
+            burst = int(os.getenv("LLM_RATE_BURST", "0")) or None
+            _shared[name] = (
+                TokenBucket(rate, burst) if rate > 0 else None,
+                CircuitBreaker(
+                    failure_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+                    reset_timeout=float(os.getenv("LLM_BREAKER_RESET_S", "30")),
+                    name=name,
+                ),
+            )
+        return _shared[name]
+
+
+def get_llm(backend=None, **kwargs):
+    """
+    Return a ResilientLLM for `backend` ("gemini" or "stub", default
+    LLM_BACKEND or "gemini"), or for an LLMBackend instance. The rate
+    limiter and circuit breaker are shared by every client of a backend in
+    the process.
+    """
+    backend = backend or os.getenv("LLM_BACKEND", "gemini")
+    if isinstance(backend, str):
+        if backend == "stub":
+            backend = LocalStubBackend()
+        elif backend == "gemini":
+            from chat_gemini import ChatGemini
+            backend = ChatGemini()
+        else:
+            raise ValueError(f"❌ Unknown LLM_BACKEND '{backend}' (expected gemini or stub)")
+    rate_limiter, breaker = _shared_guards(backend.name)
+    kwargs.setdefault("rate_limiter", rate_limiter)
+    kwargs.setdefault("breaker", breaker)
+    return ResilientLLM(backend, **kwargs)
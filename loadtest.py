@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Load test: how many concurrent chat sessions one process sustains.
+
+Simulated users hold multi-turn conversations through the same stack the
+app uses (PipelineRegistry -> RAGPipeline.ask -> HistoryManager, over the
+VectorStoreManager index) against the offline stub LLM, with an
+exponentially distributed think time between turns. Each step runs a
+fixed number of sessions for `--duration` seconds and reports throughput,
+p50/p95/p99 latency and error rate, with CPU and RSS sampled over time:
+
+    python loadtest.py --sessions 1,4,16,64
+    python loadtest.py --p95-target-ms 2000 --json load.json
+
+With `--p95-target-ms` the session count doubles from `--start-sessions`
+until a step misses the target (p95 above it or error rate above
+`--max-error-rate`), then is bisected between the last passing and the
+first failing count; the highest passing count is reported as the
+maximum sustainable number of sessions.
+"""
+
+import os
+import json
+import math
+import time
+import random
+import shutil
+import platform
+import argparse
+import threading
+import numpy as np
+from benchmark import generate_corpus, git_commit, quiet, rss_mb, summarize
+
+FOLLOW_UPS = [
+    "Can you summarize that in one sentence?",
+    "Why is that important?",
+    "What else do the documents say about it?",
+    "Are there any exceptions to that?",
+]
+
+
+class StepResults:
+    """Completed requests of one step: (finish time, latency ms, error type or None)"""
+
+    def __init__(self, label):
+        self.label = label
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, latency_ms, error=None):
+        with self._lock:
+            self.records.append((time.perf_counter(), latency_ms, error))
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.records)
+
+
+def conversation(rng, facts, turns):
+    """A conversation opens with a question from the corpus; half the later turns are follow-ups"""
+    questions = [rng.choice(facts)]
+    for _ in range(turns - 1):
+        questions.append(rng.choice(FOLLOW_UPS) if rng.random() < 0.5 else rng.choice(facts))
+    return questions
+
+
+def think_time(rng, mean_s):
+    return min(rng.expovariate(1 / mean_s), 4 * mean_s) if mean_s > 0 else 0.0
+
+
+def simulate_user(user, registry, pdf_sets, facts, args, stop, results, seed):
+    """One session: conversations of `args.turns` questions until the step ends"""
+    from llm_client import LLMError
+    from rag_pipeline import ChatSession
+
+    rng = random.Random(seed)
+    lease = registry.acquire(pdf_sets[user % len(pdf_sets)])
+    try:
+        # users don't all arrive at the same instant
+        if stop.wait(rng.uniform(0, args.think_time_s)):
+            return
+        n = 0
+        while not stop.is_set():
+            session = ChatSession(f"load-{results.label}-u{user}-c{n}")
+            n += 1
+            for question in conversation(rng, facts, args.turns):
+                start = time.perf_counter()
+                error = None
+                try:
+                    lease.pipeline.ask(question, session, use_cache=args.cache)
+                except LLMError:
+                    error = "llm"
+                except Exception as e:
+                    error = type(e).__name__
+                results.add((time.perf_counter() - start) * 1000, error)
+                if stop.wait(think_time(rng, args.think_time_s)):
+                    return
+    finally:
+        lease.release()
+
+
+def sample_resources(results, sessions, stop, interval, timeline, t0):
+    """Append CPU, RSS and the throughput/p95 of the last interval to `timeline` until `stop`"""
+    last_cpu, last_wall, seen = time.process_time(), time.perf_counter(), 0
+    while not stop.wait(interval):
+        cpu, wall = time.process_time(), time.perf_counter()
+        records = results.snapshot()
+        new, seen = records[seen:], len(records)
+        latencies = [r[1] for r in new if r[2] is None]
+        timeline.append({
+            "t_s": round(wall - t0, 2),
+            "step": results.label,
+            "sessions": sessions,
+            "cpu_pct": 100 * (cpu - last_cpu) / (wall - last_wall),
+            "rss_mb": rss_mb(),
+            "rps": len(new) / (wall - last_wall),
+            "p95_ms": float(np.percentile(latencies, 95)) if latencies else None,
+            "errors": sum(1 for r in new if r[2] is not None),
+        })
+        last_cpu, last_wall = cpu, wall
+
+
+def run_step(sessions, registry, pdf_sets, facts, args, timeline, t0, step):
+    """Run `sessions` users for args.duration seconds; statistics skip the first args.warmup_s"""
+    results = StepResults(f"s{step}")
+    stop, sampler_stop = threading.Event(), threading.Event()
+    sampler = threading.Thread(target=sample_resources, name="loadtest-sampler",
+                               args=(results, sessions, sampler_stop, args.sample_interval_s, timeline, t0))
+    users = [threading.Thread(target=simulate_user, name=f"loadtest-user-{i}",
+                              args=(i, registry, pdf_sets, facts, args, stop, results, args.seed * 100003 + step * 1009 + i))
+             for i in range(sessions)]
+    samples_before = len(timeline)
+    start = time.perf_counter()
+    with quiet(args.verbose):
+        sampler.start()
+        for user in users:
+            user.start()
+        time.sleep(args.duration)
+        stop.set()
+        for user in users:
+            user.join()
+        sampler_stop.set()
+        sampler.join()
+
+    measured_from = start + args.warmup_s
+    records = [r for r in results.snapshot() if r[0] >= measured_from and r[0] <= start + args.duration]
+    errors = {}
+    for _, _, error in records:
+        if error is not None:
+            errors[error] = errors.get(error, 0) + 1
+    samples = timeline[samples_before:]
+    window = max(args.duration - args.warmup_s, 1e-9)
+    return {
+        "sessions": sessions,
+        "requests": len(records),
+        "throughput_rps": len(records) / window,
+        "error_rate": sum(errors.values()) / len(records) if records else 0.0,
+        "errors": errors,
+        "latency": summarize([r[1] for r in records if r[2] is None]),
+        "cpu_pct_mean": float(np.mean([s["cpu_pct"] for s in samples])) if samples else None,
+        "cpu_pct_max": max((s["cpu_pct"] for s in samples), default=None),
+        "rss_mb_max": max((s["rss_mb"] for s in samples), default=rss_mb()),
+    }
+
+
+def passes(result, args):
+    return (result["requests"] > 0 and result["latency"].get("p95_ms", math.inf) <= args.p95_target_ms
+            and result["error_rate"] <= args.max_error_rate)
+
+
+def print_step(result, args):
+    latency = result["latency"]
+    line = (f"  {result['sessions']:5d} sessions  {result['throughput_rps']:7.2f} req/s  "
+            f"p50 {latency.get('p50_ms', math.nan):8.1f}ms  p95 {latency.get('p95_ms', math.nan):8.1f}ms  "
+            f"p99 {latency.get('p99_ms', math.nan):8.1f}ms  errors {result['error_rate']:6.1%}  "
+            f"CPU {result['cpu_pct_mean'] or 0:5.0f}%  RSS {result['rss_mb_max']:6.0f}MB")
+    if args.p95_target_ms:
+        line += "  ok" if passes(result, args) else "  FAIL"
+    print(line, flush=True)
+
+
+def find_max_sessions(run, args):
+    """Double the session count until a step fails, then bisect; returns the highest passing count"""
+    good, bad, n = 0, None, args.start_sessions
+    while n <= args.max_sessions:
+        if passes(run(n), args):
+            good, n = n, n * 2
+        else:
+            bad = n
+            break
+    for _ in range(args.search_steps):
+        if bad is None or bad - good <= 1:
+            break
+        mid = (good + bad) // 2
+        if passes(run(mid), args):
+            good = mid
+        else:
+            bad = mid
+    return good
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test with SLO reporting")
+    parser.add_argument("--sessions", default="1,2,4,8,16", help="comma-separated session counts to run")
+    parser.add_argument("--p95-target-ms", type=float, help="search for the max sessions meeting this p95")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="a step with more errors fails")
+    parser.add_argument("--start-sessions", type=int, default=1, help="first session count of the search")
+    parser.add_argument("--max-sessions", type=int, default=1024, help="upper bound of the search")
+    parser.add_argument("--search-steps", type=int, default=6, help="bisection steps after the first failure")
+    parser.add_argument("--duration", type=float, default=60, help="seconds per step")
+    parser.add_argument("--warmup-s", type=float, default=10, help="start of each step excluded from the statistics")
+    parser.add_argument("--think-time-s", type=float, default=5, help="mean pause between a user's questions")
+    parser.add_argument("--turns", type=int, default=4, help="questions per conversation")
+    parser.add_argument("--cache", action="store_true", help="allow semantic answer cache hits")
+    parser.add_argument("--doc-sets", type=int, default=1, help="split the corpus into this many document sets")
+    parser.add_argument("--docs", type=int, default=20, help="PDFs in the synthetic corpus")
+    parser.add_argument("--pages", type=int, default=5, help="pages per PDF")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="stub LLM time to first token")
+    parser.add_argument("--llm-tokens-per-s", type=float, default=200, help="stub LLM generation speed")
+    parser.add_argument("--llm-jitter", type=float, default=0.2, help="stub LLM extra latency, as a fraction")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0, help="stub LLM injected failures")
+    parser.add_argument("--sample-interval-s", type=float, default=1.0, help="CPU/RSS sampling interval")
+    parser.add_argument("--workdir", default="loadtest_run", help="corpus, caches and histories go here (deleted first)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show pipeline logs")
+    args = parser.parse_args()
+    if args.warmup_s >= args.duration:
+        parser.error("--warmup-s must be shorter than --duration")
+
+    workdir = os.path.abspath(args.workdir)
+    json_path = os.path.abspath(args.json) if args.json else None
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    os.chdir(workdir)  # the pipeline's faiss_cache/ and chat_history/ live here
+
+    pdfs, facts = generate_corpus("data", args.docs, args.pages, seed=args.seed)
+    doc_sets = max(1, min(args.doc_sets, len(pdfs)))
+    pdf_sets = [pdfs[i::doc_sets] for i in range(doc_sets)]
+
+    from llm_client import LocalStubBackend, ResilientLLM
+    from pipeline_registry import PipelineRegistry
+
+    llm = ResilientLLM(LocalStubBackend(latency_ms=args.llm_latency_ms, tokens_per_s=args.llm_tokens_per_s,
+                                        jitter=args.llm_jitter, failure_rate=args.llm_failure_rate,
+                                        seed=args.seed))
+    registry = PipelineRegistry(llm_factory=lambda: llm)
+    start = time.perf_counter()
+    with quiet(args.verbose):
+        # built up front and held, so steps measure answering rather than indexing
+        leases = [registry.acquire(pdf_set) for pdf_set in pdf_sets]
+        for lease in leases:
+            lease.pipeline.ask("warm up", "load-warmup", use_cache=False)
+    print(f"[INFO] Indexed {len(pdfs)} PDFs in {doc_sets} document sets in {time.perf_counter() - start:.1f}s; "
+          f"stub LLM {args.llm_latency_ms:.0f}ms, think time {args.think_time_s:.1f}s, "
+          f"{args.turns} turns per conversation, {args.duration:.0f}s per step")
+
+    timeline, steps = [], []
+    t0 = time.perf_counter()
+
+    def run(sessions):
+        result = run_step(sessions, registry, pdf_sets, facts, args, timeline, t0, len(steps))
+        steps.append(result)
+        print_step(result, args)
+        return result
+
+    max_sessions = None
+    if args.p95_target_ms:
+        print(f"\nSearching for the max sessions with p95 <= {args.p95_target_ms:.0f}ms "
+              f"and errors <= {args.max_error_rate:.1%}")
+        max_sessions = find_max_sessions(run, args)
+        print(f"\nMax sustainable sessions: {max_sessions}")
+    else:
+        print()
+        for sessions in (int(s) for s in args.sessions.split(",")):
+            run(sessions)
+    for lease in leases:
+        lease.release()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "steps": steps,
+        "max_sustainable_sessions": max_sessions,
+        "timeline": timeline,
+    }
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Report written to {json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+Process-wide metrics: counters, gauges, histograms and timing spans,
+exported in the Prometheus text format.
+
+    from metrics import counter, span
+    with span("rag.retrieve") as s:
+        ...
+    counter("answer_cache_lookups_total", "Answer cache lookups", ["result"]).inc(result="hit")
+
+Spans also land in the active trace (see `trace()`), so one slow answer
+can be broken down stage by stage. `start_metrics_server()` serves
+/metrics from a sidecar thread when METRICS_PORT is set.
+"""
+
+import os
+import time
+import math
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "smartpdf_"
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+_trace = contextvars.ContextVar("trace", default=None)
+_depth = contextvars.ContextVar("span_depth", default=0)
+_server = None
+_server_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _samples(self):
+        with self._lock:
+            return [(key, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for key, value in sorted(self._samples()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            return [(key, ([*counts], total, count)) for key, (counts, total, count) in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self._samples()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+    def quantile(self, q, **labels):
+        """Approximate quantile (upper bucket bound) of the observations with these labels"""
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            if not entry or not entry[2]:
+                return None
+            target, cumulative = q * entry[2], 0
+            for bound, n in zip(self.buckets, entry[0]):
+                cumulative += n
+                if cumulative >= target:
+                    return bound
+        return math.inf
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, documentation, labelnames, **kwargs):
+        name = PREFIX + name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as a {metric.type}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Return {metric name: {label values: value}} for display (histograms as (sum, count))"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        snapshot = {}
+        for metric in metrics:
+            values = {}
+            for key, value in metric._samples():
+                label = ",".join(f"{n}={v}" for n, v in zip(metric.labelnames, key))
+                values[label] = (value[1], value[2]) if metric.type == "histogram" else value
+            snapshot[metric.name] = values
+        return snapshot
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+# --- Spans and traces ---
+
+class Span:
+    def __init__(self, name):
+        self.name = name
+        self.seconds = None
+
+    @property
+    def ms(self):
+        return self.seconds * 1000 if self.seconds is not None else None
+
+
+@contextmanager
+def span(name):
+    """
+    Time a block: observed in span_duration_seconds{span=name}, counted in
+    span_errors_total if it raises, and appended to the active trace.
+    """
+    current = Span(name)
+    depth = _depth.get()
+    token = _depth.set(depth + 1)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException:
+        counter("span_errors_total", "Spans that ended with an exception", ["span"]).inc(span=name)
+        raise
+    finally:
+        current.seconds = time.perf_counter() - start
+        _depth.reset(token)
+        histogram("span_duration_seconds", "Duration of instrumented stages", ["span"]).observe(
+            current.seconds, span=name)
+        spans = _trace.get()
+        if spans is not None:
+            spans.append((name, depth, current.seconds * 1000))
+
+
+def record_span(name, seconds, spans=None):
+    """
+    Record a stage timed by hand, e.g. one that spans the yields of a
+    generator. It goes to `spans` if given, else to the active trace.
+    """
+    histogram("span_duration_seconds", "Duration of instrumented stages", ["span"]).observe(seconds, span=name)
+    spans = spans if spans is not None else _trace.get()
+    if spans is not None:
+        spans.append((name, _depth.get(), seconds * 1000))
+
+
+@contextmanager
+def trace():
+    """Collect the (span, depth, ms) of every span finished inside the block, in completion order"""
+    spans = []
+    token = _trace.set(spans)
+    depth = _depth.set(0)
+    try:
+        yield spans
+    finally:
+        _depth.reset(depth)
+        _trace.reset(token)
+
+
+def format_trace(spans):
+    """Indented one-line-per-span breakdown of a trace"""
+    return "\n".join(f"{'  ' * depth}{name}: {ms:.1f}ms" for name, depth, ms in sorted_trace(spans))
+
+
+def sorted_trace(spans):
+    """Order a trace's spans parent-before-children (spans are recorded when they finish)"""
+    ordered, stack = [], []
+    for name, depth, ms in spans:
+        # a span finishes after its children: children are the deeper spans recorded just before it
+        children = []
+        while stack and stack[-1][0][1] > depth:
+            children.insert(0, stack.pop())
+        stack.append(((name, depth, ms), children))
+
+    def flatten(node):
+        entry, children = node
+        ordered.append(entry)
+        for child in children:
+            flatten(child)
+
+    for node in stack:
+        flatten(node)
+    return ordered
+
+
+# --- Sidecar endpoint ---
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes every few seconds would drown the app logs
+
+
+def start_metrics_server(port=None, addr=None):
+    """
+    Serve /metrics on `port` (default METRICS_PORT; unset or 0 disables)
+    from a daemon thread. Safe to call on every Streamlit rerun.
+    """
+    global _server
+    port = int(port if port is not None else os.getenv("METRICS_PORT", "0"))
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((addr or os.getenv("METRICS_ADDR", "0.0.0.0"), port), _MetricsHandler)
+            except OSError as e:
+                # e.g. another worker process already serves this port; don't retry on every rerun
+                print(f"[WARNING] Metrics endpoint not started on port {port}: {e}")
+                _server = False
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+            print(f"[INFO] Metrics served at http://{_server.server_address[0]}:{port}/metrics")
+        return _server or None
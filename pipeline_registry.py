@@ -0,0 +1,172 @@
+import os
+import time
+import threading
+import weakref
+from embedding_service import EMBEDDING_MODEL, release_embedding_service
+from ingest_jobs import get_job_manager
+from llm_client import get_llm
+from metrics import counter, gauge
+from rag_pipeline import RAGPipeline
+from vectorstore_manager import VectorStoreManager, document_set_fingerprint
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+class PipelineLease:
+    """
+    A session's hold on a shared RAGPipeline. Released by `release()`, or
+    when the lease is garbage collected (e.g. with a closed tab's state).
+    """
+
+    def __init__(self, registry, fingerprint, pipeline, job=None):
+        self.fingerprint = fingerprint
+        self.pipeline = pipeline
+        self.job = job  # the IngestJob building the pipeline's index, if built in the background
+        self._finalizer = weakref.finalize(self, registry._release, fingerprint, pipeline)
+
+    def release(self):
+        """Give the pipeline back; safe to call more than once"""
+        self._finalizer()
+
+
+class PipelineRegistry:
+    """
+    Process-wide, reference-counted RAGPipelines keyed by document set.
+
+    Every session and tab asking about the same PDFs shares one pipeline
+    (index, retriever, reranker), all pipelines share one LLM client and
+    the process-wide embedding model. A pipeline nobody has held for
+    `idle_ttl` seconds is dropped together with its in-memory index; once
+    none are left, the LLM client and the embedding model go too. A
+    daemon janitor thread does the eviction.
+
+    With `background=True` the index is built by an ingest job and the
+    lease is returned at once; sessions arriving meanwhile share the same
+    job. A failed or cancelled build (or one still winding down after its
+    cancellation) is forgotten so the next acquire starts over, and a
+    build nobody holds a lease on any more is cancelled.
+    """
+
+    def __init__(self, idle_ttl=None, llm_factory=get_llm):
+        self.idle_ttl = idle_ttl if idle_ttl is not None else float(os.getenv("PIPELINE_IDLE_TTL_S", "900"))
+        self.llm_factory = llm_factory
+        self._entries = {}  # fingerprint -> {"pipeline", "job", "refs", "last_used"}
+        # re-entrant: a lease's finalizer may run from garbage collection while this thread holds the lock
+        self._lock = threading.RLock()
+        self._build_locks = {}
+        self._llm = None
+        self._janitor = None
+
+    def _shared_llm(self):
+        with self._lock:
+            if self._llm is None:
+                self._llm = self.llm_factory()
+            return self._llm
+
+    def acquire(self, pdf_files, buffers=None, background=False):
+        """Return a PipelineLease on the pipeline for `pdf_files`, building it if no session has it"""
+        fingerprint = document_set_fingerprint(VectorStoreManager().document_hashes(pdf_files, buffers))
+        requests = counter("pipeline_acquires_total", "Pipeline acquisitions by whether it was shared", ["result"])
+        with self._lock:
+            build_lock = self._build_locks.setdefault(fingerprint, threading.Lock())
+        with build_lock:
+            with self._lock:
+                entry = self._entries.get(fingerprint)
+            job = entry["job"] if entry is not None else None
+            if job is not None and (job.status in ("failed", "cancelled") or job.cancel_event.is_set()):
+                # its build is just being forgotten, or will end as cancelled once ingestion notices; start over
+                entry = None
+            if entry is None:
+                requests.inc(result="built")
+                pipeline = RAGPipeline(pdf_files, llm=self._shared_llm(), buffers=buffers, defer=background)
+                entry = {"pipeline": pipeline, "job": None, "refs": 0, "last_used": time.monotonic()}
+                if background:
+                    entry["job"] = get_job_manager().submit(
+                        pdf_files, lambda job: self._build(fingerprint, entry, buffers, job))
+            else:
+                requests.inc(result="shared")
+            with self._lock:
+                self._entries[fingerprint] = entry
+                entry["refs"] += 1
+                entry["last_used"] = time.monotonic()
+                self._update_gauges()
+        self._start_janitor()
+        return PipelineLease(self, fingerprint, entry["pipeline"], entry["job"])
+
+    def _build(self, fingerprint, entry, buffers, job):
+        try:
+            entry["pipeline"].build(buffers, progress=job.update, cancel=job.cancel_event)
+        except BaseException:
+            with self._lock:
+                if self._entries.get(fingerprint) is entry:
+                    del self._entries[fingerprint]
+                    self._update_gauges()
+            raise
+
+    def _release(self, fingerprint, pipeline):
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            # a lease on a pipeline whose build was started over no longer counts towards the new one
+            if entry is not None and entry["pipeline"] is pipeline:
+                entry["refs"] = max(entry["refs"] - 1, 0)
+                entry["last_used"] = time.monotonic()
+                if not entry["refs"] and entry["job"] is not None and entry["job"].active:
+                    entry["job"].cancel()
+                self._update_gauges()
+
+    def evict_idle(self, now=None):
+        """Drop pipelines unreferenced for idle_ttl, then the shared models if nothing is left"""
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            idle = [fp for fp, entry in self._entries.items()
+                    if entry["refs"] == 0 and now - entry["last_used"] >= self.idle_ttl
+                    and not (entry["job"] is not None and entry["job"].active)]
+            for fingerprint in idle:
+                del self._entries[fingerprint]
+            release_models = bool(idle) and not self._entries
+            if release_models:
+                self._llm = None
+            self._update_gauges()
+        manager = VectorStoreManager()
+        for fingerprint in idle:
+            print(f"[INFO] Evicting idle pipeline {fingerprint}")
+            manager.unload(fingerprint)
+        counter("pipeline_evictions_total", "Idle pipelines dropped from memory").inc(len(idle))
+        if release_models and not manager.loaded_count():
+            release_embedding_service(EMBEDDING_MODEL)
+        return idle
+
+    def stats(self):
+        """Return {fingerprint: refs} for the pipelines held in memory"""
+        with self._lock:
+            return {fp: entry["refs"] for fp, entry in self._entries.items()}
+
+    def _update_gauges(self):
+        gauge("pipelines_loaded", "Shared pipelines held in memory").set(len(self._entries))
+        gauge("pipeline_leases", "Sessions holding a shared pipeline").set(
+            sum(entry["refs"] for entry in self._entries.values()))
+
+    def _start_janitor(self):
+        with self._lock:
+            if self._janitor is not None:
+                return
+            self._janitor = threading.Thread(target=self._evict_loop, name="pipeline-janitor", daemon=True)
+            self._janitor.start()
+
+    def _evict_loop(self):
+        while True:
+            time.sleep(min(max(self.idle_ttl / 4, 1.0), 60.0))
+            try:
+                self.evict_idle()
+            except Exception as e:
+                print(f"[WARNING] Pipeline eviction failed: {e}")
+
+
+def get_registry():
+    """Return the process-wide PipelineRegistry"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PipelineRegistry()
+        return _registry
@@ -0,0 +1,195 @@
+import os
+import json
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None  # fall back to the ~4 characters per token rule of thumb
+
+INSTRUCTIONS = """
+        You are a professional assistant that answers questions based on the user's uploaded PDF documents.
+
+        Your primary goal:
+        - Use the PDF context below to answer the user's question as accurately as possible.
+        - If the answer is NOT found in the PDF, or is only partially related, say clearly:
+        "The definition/details are not mentioned directly in the document, but based on related context from the file, here's what can be inferred."
+
+        Rules:
+        1. Always prioritize facts and examples found in the context.
+        2. Never make up new document content — if it's not there, acknowledge it.
+        3. You may provide a short general explanation only AFTER clarifying it's not in the document.
+        4. Do NOT mention that you're an AI or language model.
+
+        -----------------------"""
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and an assistant about their PDF documents.
+Keep names, numbers and open questions; drop pleasantries. Reply with the updated summary only, at most {max_words} words.
+
+Current summary:
+{summary}
+
+New turns:
+{turns}
+"""
+
+
+def count_tokens(text):
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def truncate_tokens(text, max_tokens):
+    if max_tokens <= 0:
+        return ""
+    if _encoding is not None:
+        tokens = _encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else _encoding.decode(tokens[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def format_turns(turns):
+    return "\n".join([f"{h['role']}: {h['content']}" for h in turns])
+
+
+class PromptBuilder:
+    """
+    Assemble the RAG prompt within a token budget.
+
+    After the fixed instructions and the question, `context_share` of the
+    remaining budget goes to retrieved chunks and the rest to history.
+    Unused history budget is given back to the context. The last
+    `recent_turns` turns are kept verbatim; once more than
+    `fold_every` older turns accumulate they are folded into a rolling
+    summary that is saved next to the session's history file, so each turn
+    is only summarized once.
+    """
+
+    def __init__(self, max_tokens=None, context_share=0.6, recent_turns=None, fold_every=4,
+                 summary_tokens=300, summarizer=None):
+        self.max_tokens = max_tokens or int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+        self.context_share = context_share
+        self.recent_turns = recent_turns or int(os.getenv("PROMPT_RECENT_TURNS", "6"))
+        self.fold_every = fold_every
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer
+
+    # --- Rolling summary ---
+
+    def _summary_path(self, history):
+        return os.path.splitext(history.file_path)[0] + ".summary.json"
+
+    def _load_summary(self, history):
+        if history.file_path is None:  # in-memory history
+            return history.summary
+        path = self._summary_path(history)
+        if not os.path.exists(path):
+            return {"covered": 0, "text": ""}
+        with open(path) as f:
+            return json.load(f)
+
+    def _save_summary(self, history, summary):
+        if history.file_path is None:
+            history.summary = summary
+            return
+        path = self._summary_path(history)
+        with open(path + ".tmp", "w") as f:
+            json.dump(summary, f)
+        os.replace(path + ".tmp", path)
+
+    def _summarize(self, previous, turns):
+        if self.summarizer is not None:
+            try:
+                prompt = SUMMARY_PROMPT.format(
+                    max_words=int(self.summary_tokens * 0.75),
+                    summary=previous or "(empty)",
+                    turns=format_turns(turns),
+                )
+                return truncate_tokens(self.summarizer(prompt).strip(), self.summary_tokens)
+            except Exception as e:
+                print(f"[WARNING] History summarization failed, keeping extractive summary: {e}")
+        # extractive fallback: keep the most recent text that fits
+        text = (previous + "\n" + format_turns(turns)).strip()
+        if _encoding is not None:
+            tokens = _encoding.encode(text, disallowed_special=())
+            return _encoding.decode(tokens[-self.summary_tokens:])
+        return text[-self.summary_tokens * 4:]
+
+    def history_sections(self, history):
+        """Return (summary text, verbatim turns), folding old turns into the summary if due"""
+        summary = self._load_summary(history)
+        total = history.count()
+        unfolded = total - summary["covered"]
+        if unfolded <= 0:
+            return summary["text"], []
+        turns = history.load_history(last_n=unfolded)
+        if unfolded > self.recent_turns + self.fold_every:
+            fold = turns[:-self.recent_turns]
+            turns = turns[-self.recent_turns:]
+            summary = {
+                "covered": summary["covered"] + len(fold),
+                "text": self._summarize(summary["text"], fold),
+            }
+            self._save_summary(history, summary)
+        return summary["text"], turns
+
+    # --- Prompt assembly ---
+
+    def build(self, query, docs, history, sections=None):
+        """
+        Return (prompt, {section: tokens}) for the query, retrieved docs and
+        session history. `sections` may be a precomputed history_sections(history).
+        """
+        question = f"Question: {query}"
+        fixed = count_tokens(INSTRUCTIONS) + count_tokens(question)
+        available = max(self.max_tokens - fixed, 0)
+        history_budget = int(available * (1 - self.context_share))
+
+        summary, turns = sections if sections is not None else self.history_sections(history)
+        summary = truncate_tokens(summary, history_budget)
+        summary_tokens = count_tokens(summary) if summary else 0
+        # keep the newest turns that fit in the rest of the history budget
+        kept, used = [], summary_tokens
+        for turn in reversed(turns):
+            cost = count_tokens(f"{turn['role']}: {turn['content']}") + 1
+            if used + cost > history_budget:
+                break
+            kept.insert(0, turn)
+            used += cost
+        chat_history = format_turns(kept)
+        history_tokens = used - summary_tokens
+
+        context_budget = available - used
+        parts, context_tokens = [], 0
+        for doc in docs:
+            cost = count_tokens(doc.page_content) + 1
+            if context_tokens + cost > context_budget:
+                if not parts:
+                    parts.append(truncate_tokens(doc.page_content, context_budget))
+                    context_tokens = context_budget
+                break
+            parts.append(doc.page_content)
+            context_tokens += cost
+        context = "\n\n".join(parts)
+
+        summary_section = f"Conversation summary:\n        {summary}\n\n        " if summary else ""
+        prompt = f"""{INSTRUCTIONS}
+        📘 Document Context: {context}
+
+        {summary_section}Chat history:
+        {chat_history}
+
+        {question}
+        """
+        stats = {
+            "instructions": fixed - count_tokens(question),
+            "context": context_tokens,
+            "context_chunks": len(parts),
+            "summary": summary_tokens,
+            "history": history_tokens,
+            "history_turns": len(kept),
+            "question": count_tokens(question),
+        }
+        stats["total"] = count_tokens(prompt)
+        return prompt, stats
@@ -1,46 +1,298 @@
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from vectorstore_manager import VectorStoreManager
-from history_manager import HistoryManager
-from chat_gemini import ChatGemini
+from history_manager import EphemeralHistory, HistoryManager
+from llm_client import get_llm
+from answer_cache import get_answer_cache
+from prompt_builder import PromptBuilder
+from retrieval import HybridRetriever
+from reranker import Reranker
+from metrics import TOKEN_BUCKETS, counter, histogram, span, record_span, trace, format_trace
 
+# History writes taken off the aask critical path; plain futures so they outlive any one event loop
+_history_writer = ThreadPoolExecutor(max_workers=4, thread_name_prefix="history-writer")
+
+# Answers slower than this log their per-stage trace
+SLOW_ANSWER_S = float(os.getenv("SLOW_ANSWER_S", "10"))
+
+
+class IndexNotReady(RuntimeError):
+    """Raised when a question is asked before any document of a background build is searchable"""
+
+
+
+class ChatSession:
+    """
+    Per-conversation state: the session's history and the timings of its
+    last answer. Cheap to create; the heavy parts live in the RAGPipeline
+    shared by every session asking about the same documents. With
+    `persist=False` the history is kept in memory only.
+    """
+
+    def __init__(self, session_id, persist=True):
+        self.session_id = session_id
+        self.history = HistoryManager(session_id) if persist else EphemeralHistory()
+        self.last_timings = {}
+        self.last_prompt_stats = {}
+        self.last_trace = []
+        self.last_coverage = {}
+        self._pending_save = None
+
+
+def _as_session(session):
+    return session if isinstance(session, ChatSession) else ChatSession(session)
 
 
 class RAGPipeline:
-    def __init__(self, session_id, pdf_files):
-        self.vectorstore = VectorStoreManager().load_or_create_vectorstore(pdf_files)
-        self.history = HistoryManager(session_id)
-        self.llm = ChatGemini()
+    """
+    Question answering over one set of PDFs. Holds no per-session state,
+    so one instance (index, retriever, LLM client) serves every session;
+    each call takes the ChatSession (or a session id) it answers for.
 
+    With `defer=True` the index is built later by build(), typically in a
+    background job; questions can be asked as soon as the first PDFs are
+    indexed, and `coverage` says how many of them the answers draw on.
+    """
 
+    def __init__(self, pdf_files, llm=None, buffers=None, defer=False):
+        self.pdf_files = list(pdf_files)
+        self.vectorstore = None
+        self.retriever = None
+        self.fingerprint = None
+        self.coverage = {"documents_ready": 0, "documents_total": len(self.pdf_files)}
+        self.reranker = Reranker()
+        self.llm = llm or get_llm()
+        self.answer_cache = get_answer_cache()
+        self.prompt_builder = PromptBuilder(summarizer=self.llm.get_response)
+        if not defer:
+            self.build(buffers)
 
-    def ask(self, query):
-        docs = self.vectorstore.similarity_search(query, k=3)
-        context = "\n\n".join([d.page_content for d in docs])
-        chat_history = "\n".join([f"{h['role']}: {h['content']}" for h in self.history.load_history()])
+    def build(self, buffers=None, progress=None, cancel=None):
+        """
+        Load or build the index. `progress` and `cancel` are passed to
+        VectorStoreManager.load_or_create_vectorstore; meanwhile the
+        partially built index is attached as PDFs become searchable.
+        """
+        manager = VectorStoreManager()
+        vectorstore = manager.load_or_create_vectorstore(
+            self.pdf_files, buffers=buffers, progress=progress, cancel=cancel,
+            on_partial=self._attach if progress is not None or cancel is not None else None)
+        self.fingerprint = manager.fingerprint
+        self._attach(vectorstore, len(self.pdf_files))
+
+    def _attach(self, vectorstore, documents_ready):
+        if vectorstore is not self.vectorstore:
+            self.retriever = HybridRetriever(vectorstore)
+            self.vectorstore = vectorstore
+        self.coverage = {"documents_ready": documents_ready, "documents_total": len(self.pdf_files)}
+
+    @property
+    def ready(self):
+        """True once at least part of the index can be searched"""
+        return self.vectorstore is not None
 
-        prompt = f"""
-        You are a professional assistant that answers questions based on the user's uploaded PDF documents.
+    @property
+    def complete(self):
+        return self.ready and self.coverage["documents_ready"] >= self.coverage["documents_total"]
 
-        Your primary goal:
-        - Use the PDF context below to answer the user's question as accurately as possible.
-        - If the answer is NOT found in the PDF, or is only partially related, say clearly:
-        "The definition/details are not mentioned directly in the document, but based on related context from the file, here's what can be inferred."
+    def _start(self, session, use_cache):
+        """Common preamble of every ask: returns whether the answer cache may be used"""
+        if not self.ready:
+            raise IndexNotReady("No documents are indexed yet")
+        session.last_coverage = dict(self.coverage)
+        # answers from a partial index must not be served later for the complete one; and since
+        # the prompt includes the conversation so far, only a conversation's opening question is
+        # looked up or stored (a follow-up like "why is that?" depends on what "that" was)
+        return use_cache and self.complete and not self._has_history(session)
 
-        Rules:
-        1. Always prioritize facts and examples found in the context.
-        2. Never make up new document content — if it's not there, acknowledge it.
-        3. You may provide a short general explanation only AFTER clarifying it's not in the document.
-        4. Do NOT mention that you're an AI or language model.
+    @staticmethod
+    def _has_history(session):
+        return session._pending_save is not None or session.history.count() > 0
 
-        -----------------------
-        📘 Document Context: {context}
-        
-        Chat history:
-        {chat_history}
+    def _embed_query(self, query, timings):
+        with span("rag.embed_query") as s:
+            vector = self.vectorstore.embedding_function.embed_query(query)
+        timings["embed_ms"] = s.ms
+        return vector
 
-        Question: {query}
+    def _cached_answer(self, query_vector, use_cache):
+        if not use_cache:
+            return None
+        answer = self.answer_cache.lookup(self.fingerprint, query_vector)
+        counter("answer_cache_lookups_total", "Semantic answer cache lookups", ["result"]).inc(
+            result="miss" if answer is None else "hit")
+        if answer is not None:
+            stats = self.answer_cache.stats()
+            print(f"[INFO] Answer cache hit ({stats['hit_rate']:.0%} hit rate, "
+                  f"{stats['saved_latency_s']:.1f}s LLM latency saved)")
+        return answer
+
+    def _cache_answer(self, query_vector, response, latency, use_cache):
+        if use_cache:
+            self.answer_cache.store(self.fingerprint, query_vector, response, latency)
+
+    def _retrieve(self, query, query_vector, timings):
         """
+        Hybrid BM25 + vector retrieval, optionally reranked (the prompt
+        builder then keeps the best chunks that fit its context budget).
+        Stage latencies go into `timings`.
+        """
+        with span("rag.retrieve"):
+            if not self.reranker.enabled:
+                docs = self.retriever.retrieve(query, query_vector)
+                timings.update(self.retriever.last_timings)
+            else:
+                docs = self.retriever.retrieve(query, query_vector, k=self.reranker.candidates)
+                timings.update(self.retriever.last_timings)
+                docs = self.reranker.rerank(query, query_vector, docs, self.vectorstore.embedding_function)
+                timings.update(self.reranker.last_timings)
+                if self.reranker.last_timings["rerank_skipped"]:
+                    counter("rerank_skipped_total", "Reranks skipped for the latency budget").inc()
+            for stage in ("vector_search", "lexical_search", "fusion", "fetch", "rerank"):
+                if f"{stage}_ms" in timings:
+                    record_span(f"retrieval.{stage}", timings[f"{stage}_ms"] / 1000)
+        t = timings
+        rerank = f", rerank ({self.reranker.mode}) {t['rerank_ms']:.1f}ms" if "rerank_ms" in t else ""
+        print(f"[INFO] Retrieval ({self.retriever.mode}): vector {t['vector_search_ms']:.1f}ms, "
+              f"lexical {t['lexical_search_ms']:.1f}ms, fusion {t['fusion_ms']:.2f}ms, fetch {t['fetch_ms']:.1f}ms{rerank}")
+        return docs
+
+    def _build_prompt(self, query, query_vector, session, timings):
+        docs = self._retrieve(query, query_vector, timings)
+        with span("rag.prompt") as s:
+            prompt, stats = self.prompt_builder.build(query, docs, session.history)
+        timings["prompt_ms"] = s.ms
+        self._log_prompt_stats(session, stats)
+        return prompt
 
-        response = self.llm.get_response(prompt)
-        self.history.save_turn("user", query)
-        self.history.save_turn("assistant", response)
+    def _log_prompt_stats(self, session, stats):
+        session.last_prompt_stats = stats
+        tokens = histogram("prompt_tokens", "Prompt tokens per section", ["section"], buckets=TOKEN_BUCKETS)
+        for section in ("total", "context", "summary", "history"):
+            tokens.observe(stats[section], section=section)
+        print(f"[INFO] Prompt tokens: {stats['total']} total (context {stats['context']}, "
+              f"summary {stats['summary']}, history {stats['history']} in {stats['history_turns']} turns)")
+
+    @staticmethod
+    def _save_turns(session, query, response):
+        session.history.save_turn("user", query)
+        session.history.save_turn("assistant", response)
+
+    def _finish(self, session, spans, total):
+        session.last_trace = spans
+        if total > SLOW_ANSWER_S:
+            print(f"[WARNING] Slow answer ({total:.1f}s):\n{format_trace(spans)}")
+
+    def ask(self, query, session, use_cache=True):
+        """
+        Answer a question in `session`. A conversation's opening question is
+        served from the semantic answer cache when it nearly duplicates one
+        already answered for the same documents, unless `use_cache` is False. Raises llm_client.LLMError if the LLM
+        cannot answer; nothing is cached or saved in that case.
+        """
+        session = _as_session(session)
+        use_cache = self._start(session, use_cache)
+        start = time.perf_counter()
+        timings = {}
+        with trace() as spans, span("rag.ask"):
+            query_vector = self._embed_query(query, timings)
+            response = self._cached_answer(query_vector, use_cache)
+            if response is None:
+                prompt = self._build_prompt(query, query_vector, session, timings)
+                with span("rag.llm") as s:
+                    response = self.llm.get_response(prompt)
+                timings["llm_ms"] = s.ms
+                self._cache_answer(query_vector, response, time.perf_counter() - start, use_cache)
+            total = time.perf_counter() - start
+            session.last_timings = {"ttft": total, "total": total, **timings}
+            with span("rag.save_history"):
+                self._save_turns(session, query, response)
+        self._finish(session, spans, total)
+        return response
+
+    async def aask(self, query, session, use_cache=True):
+        """
+        Async ask: query embedding + retrieval run concurrently with loading
+        the session history, and the turn is persisted in the background
+        (the next aask waits for it, so history stays in order).
+        """
+        session = _as_session(session)
+        use_cache = self._start(session, use_cache)
+        with trace() as spans, span("rag.aask"):
+            response, total = await self._aask(query, session, use_cache)
+        self._finish(session, spans, total)
         return response
+
+    async def _aask(self, query, session, use_cache):
+        start = time.perf_counter()
+        timings = {}
+        if session._pending_save is not None:
+            await asyncio.wrap_future(session._pending_save)
+
+        async def retrieve():
+            query_vector = await asyncio.to_thread(self._embed_query, query, timings)
+            cached = self._cached_answer(query_vector, use_cache)
+            docs = None
+            if cached is None:
+                docs = await asyncio.to_thread(self._retrieve, query, query_vector, timings)
+            return query_vector, cached, docs
+
+        (query_vector, response, docs), sections = await asyncio.gather(
+            retrieve(),
+            asyncio.to_thread(self.prompt_builder.history_sections, session.history),
+        )
+        if response is None:
+            with span("rag.prompt") as s:
+                prompt, stats = self.prompt_builder.build(query, docs, session.history, sections)
+            timings["prompt_ms"] = s.ms
+            self._log_prompt_stats(session, stats)
+            with span("rag.llm") as s:
+                response = await self.llm.aget_response(prompt)
+            timings["llm_ms"] = s.ms
+            self._cache_answer(query_vector, response, time.perf_counter() - start, use_cache)
+        total = time.perf_counter() - start
+        session.last_timings = {"ttft": total, "total": total, **timings}
+        session._pending_save = _history_writer.submit(self._save_turns, session, query, response)
+        return response, total
+
+    def ask_stream(self, query, session, use_cache=True):
+        """
+        Yield the answer in chunks as the LLM streams it (a cached answer
+        is yielded whole). The turn is saved to history only after the
+        stream completes.
+        """
+        session = _as_session(session)
+        use_cache = self._start(session, use_cache)
+        start = time.perf_counter()
+        timings = {}
+        # the trace can't stay active across yields, so the streaming stages are recorded by hand
+        with trace() as spans:
+            query_vector = self._embed_query(query, timings)
+            cached = self._cached_answer(query_vector, use_cache)
+            if cached is not None:
+                chunks = [cached]
+            else:
+                chunks = self.llm.stream(self._build_prompt(query, query_vector, session, timings))
+        llm_start = time.perf_counter()
+        parts = []
+        ttft = None
+        for chunk in chunks:
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            parts.append(chunk)
+            yield chunk
+        total = time.perf_counter() - start
+        if cached is None:
+            record_span("rag.llm_stream", time.perf_counter() - llm_start, spans)
+            timings["llm_ms"] = spans[-1][2]
+        record_span("rag.ask_stream", total, spans)
+        session.last_timings = {"ttft": ttft if ttft is not None else total, "total": total, **timings}
+        print(f"[INFO] Answer streamed: first token {session.last_timings['ttft']:.2f}s, total {total:.2f}s")
+
+        response = "".join(parts)
+        if cached is None:
+            self._cache_answer(query_vector, response, total, use_cache)
+        self._save_turns(session, query, response)
+        self._finish(session, spans, total)
@@ -0,0 +1,154 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+RERANK_MODES = ("off", "mmr", "cross_encoder")
+CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+_cross_encoders = {}
+_scores = OrderedDict()  # (query digest, chunk id) -> cross-encoder score, shared by all sessions
+_lock = threading.Lock()
+
+
+def _cross_encoder(model_name):
+    """Return the process-wide CrossEncoder for model_name, loading it on first use"""
+    with _lock:
+        if model_name not in _cross_encoders:
+            from sentence_transformers import CrossEncoder
+            print(f"[INFO] Loading cross-encoder {model_name}...")
+            _cross_encoders[model_name] = (CrossEncoder(model_name, device="cpu"), threading.Lock())
+        return _cross_encoders[model_name]
+
+
+class Reranker:
+    """
+    Optional second stage after hybrid retrieval.
+
+    "cross_encoder" scores (query, chunk) pairs with a small CPU
+    cross-encoder in batches; scores are cached per (query, chunk) so a
+    repeated or regenerated question is not scored twice. "mmr" is the
+    cheap alternative: maximal marginal relevance over the chunk
+    embeddings, dropping near-duplicates. If scoring would exceed
+    `latency_budget_ms` (estimated from past batches, or measured between
+    batches) the fused retrieval order is kept instead.
+    """
+
+    def __init__(self, mode=None, candidates=None, top_k=None, batch_size=None, latency_budget_ms=None,
+                 mmr_lambda=0.7, dedup_threshold=0.95, cache_size=None, model_name=CROSS_ENCODER_MODEL):
+        self.mode = mode or os.getenv("RERANK_MODE", "off")
+        if self.mode not in RERANK_MODES:
+            raise ValueError(f"❌ Unknown RERANK_MODE '{self.mode}', expected one of {RERANK_MODES}")
+        self.candidates = candidates or int(os.getenv("RERANK_CANDIDATES", "20"))
+        self.top_k = top_k or int(os.getenv("RERANK_TOP_K", "6"))
+        self.batch_size = batch_size or int(os.getenv("RERANK_BATCH_SIZE", "16"))
+        self.latency_budget = (latency_budget_ms or float(os.getenv("RERANK_LATENCY_BUDGET_MS", "300"))) / 1000
+        self.mmr_lambda = mmr_lambda
+        self.dedup_threshold = dedup_threshold
+        self.cache_size = cache_size or int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+        self.model_name = model_name
+        self._pair_seconds = None  # moving average of cross-encoder time per pair
+        self._local = threading.local()
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    @property
+    def last_timings(self):
+        """{rerank_ms, rerank_skipped} of the calling thread's last rerank"""
+        return getattr(self._local, "timings", {})
+
+    def rerank(self, query, query_vector, docs, embeddings):
+        """Return up to top_k of `docs` (in fused order) reordered by the configured mode"""
+        start = time.perf_counter()
+        skipped = False
+        if self.mode == "cross_encoder":
+            ranked = self._cross_encoder_rank(query, docs)
+            skipped = ranked is None
+            docs = docs if skipped else ranked
+        elif self.mode == "mmr":
+            docs = self._mmr(query_vector, docs, embeddings)
+        self._local.timings = {"rerank_ms": (time.perf_counter() - start) * 1000, "rerank_skipped": skipped}
+        return docs[:self.top_k]
+
+    # --- Cross-encoder ---
+
+    def _cross_encoder_rank(self, query, docs):
+        """Return docs sorted by cross-encoder score, or None if the latency budget ran out"""
+        digest = hashlib.sha1(query.encode("utf-8")).hexdigest()
+        keys = [(digest, doc.id or hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()) for doc in docs]
+        with _lock:
+            scores = {key: _scores[key] for key in keys if key in _scores}
+        todo = [(key, doc) for key, doc in zip(keys, docs) if key not in scores]
+
+        if todo and self._pair_seconds is not None and self._pair_seconds * len(todo) > self.latency_budget:
+            print(f"[INFO] Skipping rerank: ~{self._pair_seconds * len(todo) * 1000:.0f}ms for {len(todo)} pairs "
+                  f"exceeds the {self.latency_budget * 1000:.0f}ms budget")
+            # relax the estimate so a transient slowdown doesn't disable reranking for good
+            self._pair_seconds *= 0.9
+            return None
+
+        if todo:
+            model, model_lock = _cross_encoder(self.model_name)
+            start = time.perf_counter()
+            scored = 0
+            try:
+                for i in range(0, len(todo), self.batch_size):
+                    if time.perf_counter() - start > self.latency_budget:
+                        print(f"[INFO] Rerank latency budget exceeded after {i} of {len(todo)} pairs")
+                        return None
+                    batch = todo[i:i + self.batch_size]
+                    with model_lock:
+                        batch_scores = model.predict([(query, doc.page_content) for _, doc in batch],
+                                                     batch_size=self.batch_size)
+                    for (key, _), score in zip(batch, batch_scores):
+                        scores[key] = float(score)
+                    scored += len(batch)
+            finally:
+                # keep whatever was scored, even if the budget ran out
+                self._record_speed(start, scored)
+                with _lock:
+                    for key, _ in todo[:scored]:
+                        _scores[key] = scores[key]
+                    while len(_scores) > self.cache_size:
+                        _scores.popitem(last=False)
+
+        order = sorted(range(len(docs)), key=lambda i: scores[keys[i]], reverse=True)
+        return [docs[i] for i in order]
+
+    def _record_speed(self, start, pairs):
+        if not pairs:
+            return
+        per_pair = (time.perf_counter() - start) / pairs
+        self._pair_seconds = per_pair if self._pair_seconds is None else 0.8 * self._pair_seconds + 0.2 * per_pair
+
+    # --- MMR ---
+
+    def _mmr(self, query_vector, docs, embeddings):
+        """Maximal marginal relevance selection; near-duplicate chunks are dropped"""
+        if len(docs) <= 1:
+            return docs
+        # chunk vectors come from the embedding cache, so this is a lookup rather than a forward pass
+        vectors = np.asarray(embeddings.embed_documents([d.page_content for d in docs]), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) + 1e-12)
+        relevance = vectors @ query
+        similarity = vectors @ vectors.T
+
+        selected = []
+        remaining = list(range(len(docs)))
+        while remaining and len(selected) < self.top_k:
+            if selected:
+                redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining), dtype=np.float32)
+            scores = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            best = remaining.pop(int(np.argmax(scores)))
+            if selected and similarity[best, selected].max() >= self.dedup_threshold:
+                continue
+            selected.append(best)
+        return [docs[i] for i in selected]
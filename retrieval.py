@@ -0,0 +1,102 @@
+import os
+import time
+import threading
+from contextlib import nullcontext
+import numpy as np
+
+RETRIEVAL_MODES = ("hybrid", "vector", "lexical")
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=60):
+    """Merge ranked lists of ids: each id scores sum(1 / (rrf_k + rank)) over the lists"""
+    scores = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking, 1):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever:
+    """
+    Top-k chunks for a query from FAISS and the BM25 index built next to
+    it, merged with reciprocal rank fusion. Each retriever contributes
+    `fetch_k` candidates, so exact identifiers that the embedding blurs
+    can still make the final k. Per-stage latencies (ms) of the calling
+    thread's last call are in `last_timings` (one retriever serves every
+    session on its documents).
+    """
+
+    def __init__(self, vectorstore, k=None, fetch_k=None, rrf_k=None, mode=None):
+        self.vectorstore = vectorstore
+        self.lexical_index = getattr(vectorstore, "lexical_index", None)
+        self.k = k or int(os.getenv("RETRIEVAL_K", "3"))
+        self.fetch_k = max(fetch_k or int(os.getenv("RETRIEVAL_FETCH_K", "20")), self.k)
+        self.rrf_k = rrf_k or int(os.getenv("RETRIEVAL_RRF_K", "60"))
+        self.mode = mode or os.getenv("RETRIEVAL_MODE", "hybrid")
+        if self.mode not in RETRIEVAL_MODES:
+            raise ValueError(f"❌ Unknown RETRIEVAL_MODE '{self.mode}', expected one of {RETRIEVAL_MODES}")
+        if self.lexical_index is None and self.mode != "vector":
+            print("[WARNING] No lexical index for this vectorstore, using vector search only")
+            self.mode = "vector"
+        self._local = threading.local()
+
+    @property
+    def last_timings(self):
+        return getattr(self._local, "timings", {})
+
+    def _vector_rankings(self, vectors, k):
+        """One FAISS search for a batch of query vectors; returns a list of chunk id lists"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        _, positions = self.vectorstore.index.search(vectors, k)
+        id_map = self.vectorstore.index_to_docstore_id
+        return [[id_map[p] for p in row if p != -1] for row in positions]
+
+    def _documents(self, ids):
+        docs = []
+        for id_ in ids:
+            doc = self.vectorstore.docstore.search(id_)
+            if not isinstance(doc, str):
+                docs.append(doc)
+        return docs
+
+    def retrieve_many(self, queries, query_vectors, k=None):
+        """
+        Return the fused top-k Documents for each query (FAISS is searched
+        once for the batch). `k` overrides self.k, e.g. to fetch rerank candidates.
+        """
+        # an index still being built in the background is only searched between its batch writes
+        with getattr(self.vectorstore, "write_lock", None) or nullcontext():
+            return self._retrieve_many(queries, query_vectors, k)
+
+    def _retrieve_many(self, queries, query_vectors, k):
+        timings = {"vector_search_ms": 0.0, "lexical_search_ms": 0.0, "fusion_ms": 0.0, "fetch_ms": 0.0}
+        top_k = k or self.k
+        k = max(self.fetch_k, top_k) if self.mode == "hybrid" else top_k
+        start = time.perf_counter()
+        vector_rankings = [[] for _ in queries]
+        if self.mode != "lexical":
+            vector_rankings = self._vector_rankings(query_vectors, k)
+        timings["vector_search_ms"] = (time.perf_counter() - start) * 1000
+
+        results = []
+        for query, vector_ranking in zip(queries, vector_rankings):
+            start = time.perf_counter()
+            lexical_ranking = []
+            if self.mode != "vector":
+                lexical_ranking = [id_ for id_, _ in self.lexical_index.search(query, k)]
+            lap = time.perf_counter()
+            timings["lexical_search_ms"] += (lap - start) * 1000
+
+            if self.mode == "hybrid":
+                ids = reciprocal_rank_fusion([vector_ranking, lexical_ranking], self.rrf_k)[:top_k]
+            else:
+                ids = (vector_ranking or lexical_ranking)[:top_k]
+            fused = time.perf_counter()
+            timings["fusion_ms"] += (fused - lap) * 1000
+            results.append(self._documents(ids))
+            timings["fetch_ms"] += (time.perf_counter() - fused) * 1000
+        self._local.timings = timings
+        return results
+
+    def retrieve(self, query, query_vector, k=None):
+        return self.retrieve_many([query], [query_vector], k)[0]
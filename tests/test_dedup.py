@@ -0,0 +1,65 @@
+import os
+import re
+import sys
+import random
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dedup import Deduplicator, MinHasher  # noqa: E402
+
+WORDS = ("pressure valve gasket flange torque assembly housing bearing seal pump motor sensor calibration "
+         "inspection warranty supplier invoice contract clause liability termination payment schedule").split()
+
+
+def _words(n, seed=0):
+    rng = random.Random(seed)
+    return [rng.choice(WORDS) for _ in range(n)]
+
+
+def _jaccard(a, b, k=5):
+    def shingles(text):
+        words = re.findall(r"\w+", text.lower())
+        return {" ".join(words[i:i + k]) for i in range(max(len(words) - k + 1, 1))}
+    sa, sb = shingles(a), shingles(b)
+    return len(sa & sb) / len(sa | sb)
+
+
+def test_estimate_tracks_true_jaccard():
+    hasher = MinHasher(num_perm=128)
+    words = _words(400)
+    base = " ".join(words[:200])
+    for shift in (0, 40, 80, 120, 160, 200):
+        other = " ".join(words[shift:shift + 200])
+        estimate = float(np.mean(hasher.signature(base) == hasher.signature(other)))
+        assert abs(estimate - _jaccard(base, other)) < 0.15, shift
+
+
+def _corpus_chunks(lines=6000, seed=1):
+    # numbered lines like the benchmark corpus, cut into 1000-character chunks overlapping by 200
+    # as the ingestion splitter does
+    rng = random.Random(seed)
+    text = "\n".join(f"{n // 60}.{n % 60} " + " ".join(rng.choices(WORDS, k=rng.randint(8, 14))) + "."
+                     for n in range(lines))
+    return [text[i:i + 1000] for i in range(0, len(text) - 1000, 800)]
+
+
+def test_overlapping_chunks_are_kept():
+    chunks = _corpus_chunks()
+    hasher = MinHasher()
+    for a, b in zip(chunks, chunks[1:]):
+        estimate = float(np.mean(hasher.signature(a) == hasher.signature(b)))
+        assert estimate < 0.5, (estimate, _jaccard(a, b))
+    dedup = Deduplicator(threshold=0.9)
+    kept = [dedup.check(f"c-{i}", chunk) for i, chunk in enumerate(chunks)]
+    assert kept == [f"c-{i}" for i in range(len(chunks))]
+    assert dedup.stats["near"] == 0
+
+
+def test_near_duplicates_are_dropped():
+    text = " ".join(_words(180, seed=2))
+    edited = text.replace(WORDS[0], "valves", 1)
+    dedup = Deduplicator(threshold=0.8)
+    assert dedup.check("a", text) == "a"
+    assert dedup.check("b", edited) == "a"
+    assert dedup.check("c", text.upper()) == "a"
+    assert dedup.stats == {"unique": 1, "exact": 1, "near": 1, "boilerplate_lines": 0}
@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+from metrics import counter, gauge
+
+# blobs this recent are never pruned: their build may not have created its namespace yet
+PRUNE_MIN_AGE_S = 3600
+
+
+class UploadStore:
+    """
+    Content-addressed store for uploaded PDFs.
+
+    Each upload is written once as <blob_dir>/<sha256>.pdf; uploading the
+    same bytes again (another rerun, another session, the same file under
+    a different name) finds the existing blob and writes nothing; only its
+    mtime is bumped, which records when the blob was last used.
+
+    Blobs beyond the count / disk size limits are pruned least recently
+    used first, except those an index namespace on disk still refers to.
+    """
+
+    def __init__(self, blob_dir=None, indexes_dir=None, max_blobs=None, max_disk_mb=None):
+        self.blob_dir = blob_dir or os.getenv("UPLOAD_BLOB_DIR", os.path.join("data", "blobs"))
+        self.indexes_dir = indexes_dir or os.path.join("faiss_cache", "indexes")
+        self.max_blobs = max_blobs or int(os.getenv("UPLOAD_MAX_BLOBS", "100"))
+        self.max_disk_mb = max_disk_mb or float(os.getenv("UPLOAD_MAX_DISK_MB", "0"))
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+    def path_for(self, doc_hash):
+        return os.path.join(self.blob_dir, f"{doc_hash}.pdf")
+
+    def _write_atomic(self, path, data):
+        # write to a temp file first so a concurrent reader never sees a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def put(self, data):
+        """Store `data` (bytes or a memoryview) unless already present; return (doc_hash, blob path)"""
+        doc_hash = hashlib.sha256(data).hexdigest()
+        path = self.path_for(doc_hash)
+        stored = counter("uploads_stored_total", "Uploaded PDFs by whether their blob was new", ["result"])
+        try:
+            os.utime(path)
+            stored.inc(result="existing")
+            return doc_hash, path
+        except FileNotFoundError:
+            pass
+        self._write_atomic(path, data)
+        stored.inc(result="new")
+        print(f"[INFO] Stored upload {doc_hash[:16]} ({len(data) / 1e6:.1f} MB)")
+        self.prune()
+        return doc_hash, path
+
+    def save_document_set(self, set_id, doc_hashes):
+        """
+        Record which blobs make up the document set `set_id` (an index
+        fingerprint), so any process can later resolve the id to its PDFs
+        """
+        path = os.path.join(self.blob_dir, "sets", f"{set_id}.json")
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._write_atomic(path, json.dumps(sorted(doc_hashes)).encode("utf-8"))
+
+    def load_document_set(self, set_id):
+        """Return the blob paths of document set `set_id`, or None if it was never saved"""
+        path = os.path.join(self.blob_dir, "sets", f"{set_id}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return [self.path_for(doc_hash) for doc_hash in json.load(f)]
+
+    def _referenced_hashes(self):
+        """Return the content hashes of the blobs some index namespace on disk refers to"""
+        referenced = set()
+        try:
+            fingerprints = os.listdir(self.indexes_dir)
+        except FileNotFoundError:
+            return referenced
+        for fingerprint in fingerprints:
+            # docs.json of a built namespace; the document set record of one still being built
+            for path in (os.path.join(self.indexes_dir, fingerprint, "docs.json"),
+                         os.path.join(self.blob_dir, "sets", f"{fingerprint}.json")):
+                try:
+                    with open(path) as f:
+                        referenced.update(json.load(f))
+                except (FileNotFoundError, ValueError):
+                    pass  # not written (yet), or being rewritten by another process
+        return referenced
+
+    def prune(self):
+        """
+        Delete least recently used blobs beyond the count / disk size limits,
+        skipping any that an index namespace refers to or that were used in
+        the last PRUNE_MIN_AGE_S; then drop document set records left
+        without any blob
+        """
+        entries = []
+        for name in os.listdir(self.blob_dir):
+            if not name.endswith(".pdf"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.blob_dir, name))
+            except FileNotFoundError:
+                continue  # pruned by another process meanwhile
+            entries.append((st.st_mtime, name[:-len(".pdf")], st.st_size))
+        entries.sort(reverse=True)
+        referenced = None
+        now = time.time()
+        total_mb = 0.0
+        pruned = 0
+        for i, (last_used, doc_hash, size) in enumerate(entries):
+            total_mb += size / 1e6
+            over = i >= self.max_blobs or (self.max_disk_mb and total_mb > self.max_disk_mb)
+            if not over or now - last_used < PRUNE_MIN_AGE_S:
+                continue
+            if referenced is None:
+                referenced = self._referenced_hashes()
+            if doc_hash in referenced:
+                continue
+            try:
+                os.unlink(self.path_for(doc_hash))
+            except FileNotFoundError:
+                continue
+            print(f"[INFO] Pruned stored upload {doc_hash[:16]}")
+            total_mb -= size / 1e6
+            pruned += 1
+        if pruned:
+            self._prune_document_sets()
+        counter("uploads_pruned_total", "Stored upload blobs deleted from disk").inc(pruned)
+        gauge("upload_blobs", "Upload blobs stored on disk").set(len(entries) - pruned)
+        gauge("upload_disk_bytes", "Disk used by stored upload blobs").set(int(total_mb * 1e6))
+
+    def _prune_document_sets(self):
+        sets_dir = os.path.join(self.blob_dir, "sets")
+        try:
+            names = os.listdir(sets_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            path = os.path.join(sets_dir, name)
+            try:
+                with open(path) as f:
+                    doc_hashes = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+            if not any(os.path.exists(self.path_for(doc_hash)) for doc_hash in doc_hashes):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
@@ -1,79 +1,531 @@
 import os
-import pickle
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import json
+import fcntl
+import shutil
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+import faiss
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.document_loaders import PyPDFLoader
+from embedding_cache import CachedEmbeddings, get_embedding_cache
+from embedding_service import EMBEDDING_MODEL, get_embedding_service
+from chunk_store import SQLiteDocstore
+from ingestion import IngestionPipeline
+from dedup import Deduplicator
+from lexical_index import BM25Index
+from ann_index import IndexConfig, apply_search_params, ensure_index_type, remove_positions
+from metrics import counter, gauge, histogram, span
+
+# Read-only indexes are memory-mapped so worker processes share the same pages
+MMAP_FLAGS = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+
+# Process-wide LRU of loaded vectorstores, keyed by (indexes dir, document-set fingerprint)
+_loaded = OrderedDict()
+_loaded_lock = threading.Lock()
+_build_locks = {}
+# shared flocks on the `.in_use` file of each namespace in _loaded, so other processes don't evict it
+_in_use = {}
+
+
+def document_set_fingerprint(doc_hashes):
+    """Return a stable id for a set of PDF content hashes"""
+    return hashlib.sha256("\n".join(sorted(set(doc_hashes))).encode()).hexdigest()[:16]
+
 
 class VectorStoreManager:
-    def __init__(self, cache_dir="faiss_cache"):
+    def __init__(self, cache_dir="faiss_cache", parse_workers=None, embed_batch_size=None, index_config=None,
+                 max_loaded=None, max_namespaces=None, max_disk_mb=None, dedup=None):
         self.cache_dir = cache_dir
-        os.makedirs(self.cache_dir, exist_ok=True)
-        self.cache_file = os.path.join(self.cache_dir, "kb_index.pkl")
-        self.metadata_file = os.path.join(self.cache_dir, "pdf_metadata.pkl")
-
-    def _get_pdf_metadata(self, pdf_files):
-        """Return a dictionary of {pdf_file: last_modified_time}"""
-        return {pdf: os.path.getmtime(pdf) for pdf in pdf_files}
-
-    def _has_pdf_changed(self, pdf_files):
-        """Check if PDFs have changed since last cache"""
-        current_metadata = self._get_pdf_metadata(pdf_files)
-        if not os.path.exists(self.metadata_file):
-            return True  # no previous metadata
-        with open(self.metadata_file, "rb") as f:
-            cached_metadata = pickle.load(f)
-        # Compare metadata
-        return cached_metadata != current_metadata
-
-    def load_or_create_vectorstore(self, pdf_files, rebuild=False):
+        self.dedup = dedup if dedup is not None else os.getenv("DEDUP", "1") == "1"
+        self.index_config = index_config or IndexConfig()
+        self.parse_workers = parse_workers
+        self.embed_batch_size = embed_batch_size
+        self.max_loaded = max_loaded or int(os.getenv("VECTORSTORE_MAX_LOADED", "4"))
+        self.max_namespaces = max_namespaces or int(os.getenv("VECTORSTORE_MAX_NAMESPACES", "20"))
+        self.max_disk_mb = max_disk_mb or float(os.getenv("VECTORSTORE_MAX_DISK_MB", "0"))
+        self.last_ingest_timings = {}
+        self.last_timings = {}  # seconds per stage of the last load_or_create_vectorstore
+        self.fingerprint = None
+        self.indexes_dir = os.path.join(self.cache_dir, "indexes")
+        os.makedirs(self.indexes_dir, exist_ok=True)
+        self.embedding_cache_dir = os.path.join(self.cache_dir, "embeddings")
+
+    def _embeddings(self):
+        """Return the shared embedding model wrapped with the persistent chunk embedding cache"""
+        return CachedEmbeddings(
+            get_embedding_service(EMBEDDING_MODEL),
+            get_embedding_cache(self.embedding_cache_dir, EMBEDDING_MODEL),
+        )
+
+    def _file_hash(self, path):
+        """Return the sha256 hex digest of a file's content"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def document_hashes(self, pdf_files, buffers=None):
+        """Return {content hash: pdf_file}, hashing in-memory `buffers` instead of reading those files"""
+        buffers = buffers or {}
+        current = {}
+        for pdf in pdf_files:
+            data = buffers.get(pdf)
+            current[self._file_hash(pdf) if data is None else hashlib.sha256(data).hexdigest()] = pdf
+        return current
+
+    # --- Namespaces ---
+
+    def _namespace_dir(self, fingerprint):
+        return os.path.join(self.indexes_dir, fingerprint)
+
+    @contextmanager
+    def _namespace_lock(self, fingerprint):
+        """Serialize builds of one namespace across threads and processes"""
+        ns_dir = self._namespace_dir(fingerprint)
+        with _loaded_lock:
+            lock = _build_locks.setdefault(os.path.abspath(ns_dir), threading.Lock())
+        lock_path = os.path.join(ns_dir, ".lock")
+        with lock:
+            while True:
+                os.makedirs(ns_dir, exist_ok=True)
+                f = open(lock_path, "a")
+                fcntl.flock(f, fcntl.LOCK_EX)
+                # another process may have evicted the namespace while we waited; lock the new one then
+                try:
+                    if os.path.samestat(os.fstat(f.fileno()), os.stat(lock_path)):
+                        break
+                except FileNotFoundError:
+                    pass
+                f.close()
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+                f.close()
+
+    def _try_lock_for_eviction(self, fingerprint):
+        """
+        Return the open lock files if nobody builds (`.lock`) or holds in
+        memory (`.in_use`) the namespace, else None; never blocks
+        """
+        ns_dir = self._namespace_dir(fingerprint)
+        files = []
+        try:
+            for name in (".lock", ".in_use"):
+                f = open(os.path.join(ns_dir, name), "a")
+                files.append(f)
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return files
+        except OSError:  # BlockingIOError if locked, FileNotFoundError if already removed
+            for f in files:
+                f.close()
+            return None
+
+    def _namespace_docs(self, fingerprint):
+        path = os.path.join(self._namespace_dir(fingerprint), "docs.json")
+        if not os.path.exists(path):
+            return set()
+        with open(path) as f:
+            return set(json.load(f))
+
+    def _seed_namespace(self, fingerprint, doc_hashes):
+        """
+        Start a new namespace from the cached one sharing the most documents,
+        so only the difference has to be embedded or deleted.
+        """
+        best, best_overlap = None, 0
+        for other in os.listdir(self.indexes_dir):
+            if other == fingerprint:
+                continue
+            overlap = len(self._namespace_docs(other) & doc_hashes)
+            if overlap > best_overlap:
+                best, best_overlap = other, overlap
+        if best is None:
+            return
+        src_dir, dst_dir = self._namespace_dir(best), self._namespace_dir(fingerprint)
+        print(f"[INFO] Seeding index {fingerprint} from {best} ({best_overlap} shared PDFs)")
+        with self._namespace_lock(best):
+            if not os.path.exists(os.path.join(src_dir, "kb.faiss")):
+                return
+            shutil.copyfile(os.path.join(src_dir, "kb.faiss"), os.path.join(dst_dir, "kb.faiss"))
+            if os.path.exists(os.path.join(src_dir, "kb.bm25.npz")):
+                shutil.copyfile(os.path.join(src_dir, "kb.bm25.npz"), os.path.join(dst_dir, "kb.bm25.npz"))
+            src = sqlite3.connect(os.path.join(src_dir, "kb.sqlite"))
+            dst = sqlite3.connect(os.path.join(dst_dir, "kb.sqlite"))
+            src.backup(dst)
+            src.close()
+            dst.close()
+
+    def _touch(self, fingerprint):
+        """Mark the namespace as used now; returns False if its directory is gone"""
+        marker = os.path.join(self._namespace_dir(fingerprint), ".last_used")
+        try:
+            with open(marker, "a"):
+                os.utime(marker)
+        except FileNotFoundError:
+            return False
+        return True
+
+    @staticmethod
+    def _namespace_usage(ns_dir):
+        """Return (last used mtime, bytes); files vanishing meanwhile (WAL, temp files) are skipped"""
+        marker = os.path.join(ns_dir, ".last_used")
+        last_used = os.path.getmtime(marker) if os.path.exists(marker) else 0
+        size = 0
+        for name in os.listdir(ns_dir):
+            try:
+                size += os.path.getsize(os.path.join(ns_dir, name))
+            except FileNotFoundError:
+                pass
+        return last_used, size
+
+    def _evict_namespaces(self, keep):
+        """
+        Delete least recently used namespaces beyond the count / disk size
+        limits, skipping any that a process is building or holds in memory
+        """
+        entries = []
+        for fingerprint in os.listdir(self.indexes_dir):
+            try:
+                last_used, size = self._namespace_usage(self._namespace_dir(fingerprint))
+            except FileNotFoundError:
+                continue  # removed by another process meanwhile
+            entries.append((last_used, fingerprint, size))
+        entries.sort(reverse=True)
+        with _loaded_lock:
+            in_use = {fingerprint for _, fingerprint in _loaded}
+        total_mb = 0.0
+        evicted = 0
+        for i, (_, fingerprint, size) in enumerate(entries):
+            total_mb += size / 1e6
+            over = i >= self.max_namespaces or (self.max_disk_mb and total_mb > self.max_disk_mb)
+            if not over or fingerprint == keep or fingerprint in in_use:
+                continue
+            locks = self._try_lock_for_eviction(fingerprint)
+            if locks is None:
+                continue
+            try:
+                print(f"[INFO] Evicting cached index {fingerprint}")
+                shutil.rmtree(self._namespace_dir(fingerprint), ignore_errors=True)
+            finally:
+                for f in locks:
+                    f.close()
+            total_mb -= size / 1e6
+            evicted += 1
+        counter("vectorstore_evictions_total", "Cached index namespaces deleted from disk").inc(evicted)
+        gauge("vectorstore_namespaces", "Index namespaces cached on disk").set(len(entries) - evicted)
+        gauge("vectorstore_disk_bytes", "Disk used by cached index namespaces").set(int(total_mb * 1e6))
+
+    def _remember(self, fingerprint, vectorstore):
+        key = (os.path.abspath(self.indexes_dir), fingerprint)
+        with _loaded_lock:
+            _loaded[key] = vectorstore
+            _loaded.move_to_end(key)
+            if key not in _in_use:
+                f = open(os.path.join(self._namespace_dir(fingerprint), ".in_use"), "a")
+                fcntl.flock(f, fcntl.LOCK_SH)
+                _in_use[key] = f
+            while len(_loaded) > self.max_loaded:
+                self._forget(_loaded.popitem(last=False)[0])
+            self._update_loaded_gauges()
+
+    @staticmethod
+    def _forget(key):
+        f = _in_use.pop(key, None)
+        if f is not None:
+            f.close()  # releases the shared lock
+
+    def unload(self, fingerprint):
+        """Drop a namespace's vectorstore from memory (its files stay cached on disk)"""
+        key = (os.path.abspath(self.indexes_dir), fingerprint)
+        with _loaded_lock:
+            _loaded.pop(key, None)
+            self._forget(key)
+            self._update_loaded_gauges()
+
+    @staticmethod
+    def loaded_count():
+        with _loaded_lock:
+            return len(_loaded)
+
+    @staticmethod
+    def _update_loaded_gauges():
+        gauge("vectorstores_loaded", "Vectorstores held in memory").set(len(_loaded))
+        gauge("resident_vectors", "Vectors in the indexes held in memory").set(
+            sum(vs.index.ntotal for vs in _loaded.values()))
+
+    # --- Index building ---
+
+    def _read_index(self, index_file, writable):
+        index = None
+        if not writable:
+            try:
+                index = faiss.read_index(index_file, MMAP_FLAGS)
+                print("[INFO] Memory-mapped cached FAISS index")
+            except RuntimeError:
+                pass  # not every index type supports mmap
+        if index is None:
+            index = faiss.read_index(index_file)
+        return apply_search_params(index, self.index_config)
+
+    def _delete(self, vectorstore, ids):
+        """Delete chunk ids from the index and docstore, keeping positions contiguous"""
+        reversed_index = {id_: pos for pos, id_ in vectorstore.index_to_docstore_id.items()}
+        positions = {reversed_index[id_] for id_ in ids}
+        vectorstore.index = remove_positions(vectorstore.index, positions, self.index_config)
+        vectorstore.docstore.delete(ids)
+        remaining = [id_ for pos, id_ in sorted(vectorstore.index_to_docstore_id.items()) if pos not in positions]
+        vectorstore.index_to_docstore_id = dict(enumerate(remaining))
+        vectorstore.lexical_index.remove(ids)
+
+    def _load_lexical_index(self, ns_dir, vectorstore):
+        """Load the namespace's BM25 index, rebuilding it from the chunk store if missing or stale"""
+        lexical_file = os.path.join(ns_dir, "kb.bm25.npz")
+        if os.path.exists(lexical_file):
+            lexical = BM25Index.load(lexical_file)
+            if len(lexical) == len(vectorstore.index_to_docstore_id):
+                return lexical, False
+        print("[INFO] Building lexical index from the chunk store...")
+        lexical = BM25Index()
+        for ids, texts in vectorstore.docstore.iter_chunks():
+            lexical.add(ids, texts)
+        return lexical, True
+
+    def warm(self, limit=1):
+        """
+        Load the `limit` most recently used namespaces into memory without
+        their PDFs (they are unchanged, so the indexes are memory-mapped),
+        e.g. in the background right after startup.
+        """
+        entries = []
+        for fingerprint in os.listdir(self.indexes_dir):
+            marker = os.path.join(self._namespace_dir(fingerprint), ".last_used")
+            if os.path.exists(marker):
+                entries.append((os.path.getmtime(marker), fingerprint))
+        for _, fingerprint in sorted(entries, reverse=True)[:limit]:
+            with _loaded_lock:
+                if (os.path.abspath(self.indexes_dir), fingerprint) in _loaded:
+                    continue
+            with self._namespace_lock(fingerprint):
+                store = SQLiteDocstore(os.path.join(self._namespace_dir(fingerprint), "kb.sqlite"))
+                manifest = store.load_manifest()
+                store.close()
+                if not manifest:
+                    continue
+                vectorstore = self._build(fingerprint, {h: d["source"] for h, d in manifest.items()}, rebuild=False)
+            if vectorstore is not None:
+                self._remember(fingerprint, vectorstore)
+
+    def load_or_create_vectorstore(self, pdf_files, rebuild=False, buffers=None, progress=None, cancel=None,
+                                   on_partial=None):
         """
-        Load cached FAISS vectorstore, or create a new one from PDFs.
-        Automatically rebuilds if PDFs have changed.
+        Load the FAISS vectorstore for this set of PDFs, or create it.
+        Each distinct document set gets its own index directory keyed by
+        the fingerprint of its content hashes, and recently used ones stay
+        loaded in memory. A new set starts from the most similar cached
+        index, so only added PDFs are embedded and missing ones deleted.
+        The returned vectorstore carries the namespace's BM25 index as
+        `lexical_index`, kept in step with the FAISS index. `buffers`
+        optionally maps PDF paths to their bytes already in memory (e.g.
+        uploads), which are then hashed and parsed without reading the file.
+
+        For background builds, `progress(pdf_file, stage, **counts)` and
+        the `cancel` event go to the ingestion (see IngestionPipeline.run);
+        a cancelled or failed build leaves the namespace as it was on disk.
+        `on_partial(vectorstore, documents_ready)` is called each time more
+        PDFs become searchable, with a vectorstore that is still being
+        written to: searches must hold its `write_lock` until the build
+        returns.
         """
-        # Check if rebuild is needed
-        if rebuild or self._has_pdf_changed(pdf_files):
-            print("[INFO] Rebuilding vectorstore due to PDF changes or rebuild request...")
-            if os.path.exists(self.cache_file):
-                os.remove(self.cache_file)
-
-        # Load cache if exists
-        if os.path.exists(self.cache_file):
-            print("[INFO] Loading cached vectorstore...")
-            with open(self.cache_file, "rb") as f:
-                vectorstore = pickle.load(f)
+        current = self.document_hashes(pdf_files, buffers)
+        fingerprint = document_set_fingerprint(current)
+        self.fingerprint = fingerprint
+        self.last_timings = {}
+        key = (os.path.abspath(self.indexes_dir), fingerprint)
+
+        requests = counter("vectorstore_requests_total", "load_or_create_vectorstore calls", ["source"])
+        if not rebuild:
+            with _loaded_lock:
+                vectorstore = _loaded.get(key)
+                if vectorstore is not None:
+                    _loaded.move_to_end(key)
+            if vectorstore is not None:
+                if self._touch(fingerprint):
+                    print(f"[INFO] Using loaded vectorstore {fingerprint}")
+                    requests.inc(source="memory")
+                    return vectorstore
+                print(f"[WARNING] Cached index {fingerprint} was removed from disk, rebuilding it")
+                self.unload(fingerprint)
+
+        requests.inc(source="disk")
+        with span("vectorstore.load_or_create"), self._namespace_lock(fingerprint):
+            # a namespace being built counts as just used, so it is not the first one evicted
+            self._touch(fingerprint)
+            index_file = os.path.join(self._namespace_dir(fingerprint), "kb.faiss")
+            if not rebuild and not os.path.exists(index_file):
+                self._seed_namespace(fingerprint, set(current))
+            vectorstore = self._build(fingerprint, current, rebuild, buffers, progress, cancel, on_partial)
+            self._touch(fingerprint)
+        if vectorstore is not None:
+            self._remember(fingerprint, vectorstore)
+        self._evict_namespaces(keep=fingerprint)
+        return vectorstore
+
+    def _build(self, fingerprint, current, rebuild, buffers=None, progress=None, cancel=None, on_partial=None):
+        """Bring the namespace's index in line with `current` ({doc_hash: pdf_file})"""
+        ns_dir = self._namespace_dir(fingerprint)
+        index_file = os.path.join(ns_dir, "kb.faiss")
+        store = SQLiteDocstore(os.path.join(ns_dir, "kb.sqlite"))
+        manifest = store.load_manifest()
+        if rebuild or not os.path.exists(index_file):
+            store.clear()
+            manifest = {}
+
+        added = [h for h in current if h not in manifest]
+        removed = [h for h in manifest if h not in current]
+        renamed = [h for h in current if h in manifest and manifest[h]["source"] != current[h]]
+        for doc_hash in renamed:
+            manifest[doc_hash]["source"] = current[doc_hash]
+
+        vectorstore, lexical_stale = None, False
+        if manifest:
+            print(f"[INFO] Loading cached vectorstore {fingerprint}...")
+            with span("vectorstore.load") as s:
+                # an mmapped index is read-only, so only map it when nothing changes
+                index = self._read_index(index_file, writable=bool(added or removed))
+                vectorstore = FAISS(self._embeddings(), index, store, store.load_index_map())
+                vectorstore.lexical_index, lexical_stale = self._load_lexical_index(ns_dir, vectorstore)
+            self.last_timings["load"] = s.seconds
             print(f"[INFO] Loaded vectorstore with {len(vectorstore.index_to_docstore_id)} vectors.")
+
+        if not added and not removed:
+            if renamed:
+                store.save(manifest, vectorstore.index_to_docstore_id)
+            if vectorstore is not None and lexical_stale:
+                vectorstore.lexical_index.save(os.path.join(ns_dir, "kb.bm25.npz"))
+            if vectorstore is None:
+                print("[WARNING] No documents loaded from PDFs!")
             return vectorstore
 
-        # Build new vectorstore
-        print("[INFO] Building vectorstore from PDFs...")
-        docs = []
-        for file in pdf_files:
-            print(f"[INFO] Loading PDF: {file}")
-            loader = PyPDFLoader(file)
-            pdf_docs = loader.load()
-            print(f"[INFO] {len(pdf_docs)} pages loaded from {file}")
-            docs.extend(pdf_docs)
-
-        if not docs:
-            print("[WARNING] No documents loaded from PDFs!")
-            return None
+        print(f"[INFO] Updating vectorstore: {len(added)} added, {len(removed)} removed PDFs")
+        counter("vectorstore_builds_total", "Index builds and updates", ["kind"]).inc(
+            kind="rebuild" if rebuild else "incremental" if vectorstore is not None else "new")
+        counter("ingested_documents_total", "PDFs added to or removed from indexes", ["change"]).inc(
+            len(added), change="added")
+        counter("ingested_documents_total", "PDFs added to or removed from indexes", ["change"]).inc(
+            len(removed), change="removed")
+
+        if removed:
+            # a deduplicated chunk stays while any remaining document still refers to it
+            kept_ids = {i for h, d in manifest.items() if h not in removed for i in d["ids"]}
+            stale_ids = list(dict.fromkeys(i for h in removed for i in manifest[h]["ids"] if i not in kept_ids))
+            store.delete_references(removed)
+            store.promote_references([i for h in removed for i in manifest[h]["ids"]
+                                      if i in kept_ids and i.startswith(h[:16])])
+            if stale_ids:
+                with span("vectorstore.delete"):
+                    self._delete(vectorstore, stale_ids)
+            for doc_hash in removed:
+                print(f"[INFO] Removed {len(manifest[doc_hash]['ids'])} vectors of {manifest[doc_hash]['source']}")
+                del manifest[doc_hash]
+
+        if added:
+            embeddings = vectorstore.embedding_function if vectorstore else self._embeddings()
+            # the cache is shared by the whole process: report this build's share of its lookups
+            stats_before = embeddings.cache.stats()
+            target = {"vectorstore": vectorstore}
+            # searches of the partial index hold this lock while batches are added
+            write_lock = threading.RLock()
+            ready = [len(current) - len(added)]
+            if vectorstore is not None:
+                vectorstore.write_lock = write_lock
+                for doc_hash in current:
+                    if doc_hash not in added and progress is not None:
+                        progress(current[doc_hash], "indexed", cached=True)
+                if on_partial is not None and ready[0]:
+                    on_partial(vectorstore, ready[0])
 
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        chunks = splitter.split_documents(docs)
-        print(f"[INFO] Created {len(chunks)} text chunks for embeddings")
+            def add_batch(texts, vectors, metadatas, ids):
+                with write_lock:
+                    if target["vectorstore"] is None:
+                        index = faiss.IndexFlatL2(len(vectors[0]))
+                        target["vectorstore"] = FAISS(embeddings, index, store, {})
+                        target["vectorstore"].lexical_index = BM25Index()
+                        target["vectorstore"].write_lock = write_lock
+                    target["vectorstore"].add_embeddings(zip(texts, vectors), metadatas=metadatas, ids=ids)
+                    target["vectorstore"].lexical_index.add(ids, texts)
 
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        vectorstore = FAISS.from_documents(chunks, embeddings)
-        print(f"[INFO] Vectorstore created with {len(vectorstore.index_to_docstore_id)} vectors")
+            def on_progress(doc_hash, stage, **counts):
+                if progress is not None:
+                    progress(current[doc_hash], stage, **counts)
+                if stage == "indexed" and on_partial is not None:
+                    with write_lock:
+                        ready[0] += 1
+                        partial, documents_ready = target["vectorstore"], ready[0]
+                    if partial is not None:
+                        on_partial(partial, documents_ready)
 
-        # Cache vectorstore
-        with open(self.cache_file, "wb") as f:
-            pickle.dump(vectorstore, f)
-            print(f"[INFO] Vectorstore cached at {self.cache_file}")
+            deduplicator = None
+            if self.dedup:
+                stored = len(vectorstore.index_to_docstore_id) if vectorstore is not None else 0
+                deduplicator = Deduplicator.load(store, stored_chunks=stored)
+            pipeline = IngestionPipeline(embeddings, self.parse_workers, self.embed_batch_size,
+                                         deduplicator=deduplicator)
+            try:
+                with span("vectorstore.ingest"):
+                    doc_ids = pipeline.run([(h, current[h]) for h in added], add_batch, buffers, cancel=cancel,
+                                           progress=on_progress if progress or on_partial else None)
+            except BaseException:
+                store.rollback()
+                raise
+            if deduplicator is not None:
+                store.add_dedup_entries(deduplicator.new_entries)
+                store.add_references(pipeline.references)
+                deduplicator.record_metrics()
+            self.last_ingest_timings = pipeline.timings
+            stage_seconds = histogram("ingest_stage_seconds", "Time per ingestion stage and build", ["stage"])
+            for stage in ("parse", "split", "dedup", "embed", "index"):
+                stage_seconds.observe(pipeline.timings[stage], stage=stage)
+            self.last_timings.update({"ingest" if k == "total" else k: v for k, v in pipeline.timings.items()})
+            vectorstore = target["vectorstore"]
+            for doc_hash, ids in doc_ids.items():
+                manifest[doc_hash] = {"source": current[doc_hash], "ids": ids}
+            stats = embeddings.cache.stats()
+            for field in ("hits", "misses"):
+                stats[field] -= stats_before[field]
+            lookups_total = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups_total if lookups_total else 0.0
+            lookups = counter("embedding_cache_lookups_total", "Chunk embedding cache lookups", ["result"])
+            lookups.inc(stats["hits"], result="hit")
+            lookups.inc(stats["misses"], result="miss")
+            print(f"[INFO] Embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+                  f"({stats['hit_rate']:.0%} hit rate, {stats['entries']} entries)")
 
-        # Save PDF metadata
-        with open(self.metadata_file, "wb") as f:
-            pickle.dump(self._get_pdf_metadata(pdf_files), f)
+        if vectorstore is None:
+            print("[WARNING] No documents loaded from PDFs!")
+            store.save(manifest, {})
+            return None
 
+        with getattr(vectorstore, "write_lock", None) or nullcontext():
+            vectorstore.index = ensure_index_type(vectorstore.index, self.index_config)
+        print(f"[INFO] Vectorstore now has {len(vectorstore.index_to_docstore_id)} vectors")
+        with span("vectorstore.persist") as s:
+            self._save(ns_dir, vectorstore, manifest)
+        self.last_timings["persist"] = s.seconds
+        vectorstore.write_lock = None  # complete: no more writes, searches needn't lock
         return vectorstore
+
+    def _save(self, ns_dir, vectorstore, manifest):
+        """Persist the FAISS and BM25 indexes and commit the chunk store"""
+        index_file = os.path.join(ns_dir, "kb.faiss")
+        tmp_file = index_file + ".tmp"
+        faiss.write_index(vectorstore.index, tmp_file)
+        os.replace(tmp_file, index_file)
+        vectorstore.lexical_index.save(os.path.join(ns_dir, "kb.bm25.npz"))
+        vectorstore.docstore.save(manifest, vectorstore.index_to_docstore_id)
+        with open(os.path.join(ns_dir, "docs.json"), "w") as f:
+            json.dump(sorted(manifest), f)
+        print(f"[INFO] Vectorstore cached at {index_file}")
@@ -0,0 +1,76 @@
+"""
+Background warm-up for the Streamlit app.
+
+The app only imports streamlit and a few small modules before its first
+paint. start_warmup() then imports the heavy stack (langchain, FAISS,
+torch, the Gemini SDK), loads the embedding model and maps the most
+recently used index in a daemon thread, so the first question after an
+upload doesn't pay for it. Run `python import_profile.py` to see the
+import budget before and after.
+"""
+
+import os
+import time
+import threading
+from metrics import gauge
+
+_state = {"status": "idle", "timings": {}, "error": None}
+_lock = threading.Lock()
+_thread = None
+
+
+def _stage(name, start):
+    seconds = time.perf_counter() - start
+    _state["timings"][name] = seconds
+    gauge("warmup_seconds", "Background warm-up time per stage", ["stage"]).set(seconds, stage=name)
+    return time.perf_counter()
+
+
+def _run(indexes):
+    _state["status"] = "running"
+    try:
+        start = time.perf_counter()
+        import rag_pipeline  # noqa: F401 -- langchain, FAISS, numpy
+        start = _stage("imports", start)
+
+        from embedding_service import EMBEDDING_MODEL, get_embedding_service
+        get_embedding_service(EMBEDDING_MODEL).embed_query("warm up")
+        start = _stage("embedding_model", start)
+
+        if indexes:
+            from vectorstore_manager import VectorStoreManager
+            VectorStoreManager().warm(indexes)
+            start = _stage("indexes", start)
+
+        if os.getenv("LLM_BACKEND", "gemini") == "gemini":
+            import chat_gemini  # noqa: F401 -- google.generativeai
+            _stage("llm_client", start)
+
+        _state["status"] = "done"
+        summary = ", ".join(f"{k} {v:.1f}s" for k, v in _state["timings"].items())
+        print(f"[INFO] Warm-up finished ({summary})")
+    except Exception as e:
+        _state["status"] = "failed"
+        _state["error"] = str(e)
+        print(f"[WARNING] Warm-up failed, components will load on first use: {e}")
+
+
+def start_warmup(indexes=None):
+    """
+    Start the warm-up thread once per process and return immediately.
+    `indexes` recently used indexes are loaded (default WARMUP_INDEXES);
+    WARMUP=0 disables warm-up altogether.
+    """
+    global _thread
+    if os.getenv("WARMUP", "1") == "0":
+        return
+    with _lock:
+        if _thread is None:
+            indexes = indexes if indexes is not None else int(os.getenv("WARMUP_INDEXES", "1"))
+            _thread = threading.Thread(target=_run, args=(indexes,), name="warmup", daemon=True)
+            _thread.start()
+
+
+def warmup_status():
+    """Return {"status": idle|running|done|failed, "timings": {stage: seconds}, "error": ...}"""
+    return {**_state, "timings": dict(_state["timings"])}